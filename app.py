@@ -1,37 +1,108 @@
 import streamlit as st
+import os
+import datetime
 import threading
-import queue
-import time
-import pandas as pd
-import plotly.express as px
-from sklearn.decomposition import PCA
-import numpy as np
-from stt_service import STTService
-from rag_service import RAGService
-from llm_service import LLMService
+import uuid
+from context_builder import ContextBuilder
+from live_refiner import BackgroundRefiner
+from service_loader import ServiceLoader
+from transcript_store import TranscriptStore
+from metrics import metrics, start_exporters_from_env
+
+# Model-backed services are imported and built on background threads (see
+# get_service_loader), so the page renders before Whisper and the embedding model load.
+
+def load_stt():
+    if os.getenv("STT_SHARED_ENGINE") == "1":
+        # Opt-in: one Whisper model shared by every browser session (chunked, batched decoding)
+        from stt_engine import STTEngine
+        return STTEngine(model_size="medium")
+    # Streaming mode: rolling-window decoding with partial results and bounded lag
+    from stt_service import STTService
+    return STTService(model_size="medium", streaming=True)
+
+def load_rag():
+    from rag_service import RAGService
+    return RAGService(
+        url=os.getenv("QDRANT_URL"),
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        vector_quantization=os.getenv("VECTOR_QUANTIZATION") or None,
+    )
 
 # Initialize Services (Singleton pattern using st.cache_resource)
 @st.cache_resource
-def get_stt_service():
-    # Using "small" model for better balance of speed and accuracy
-    return STTService(model_size="medium")
+def get_service_loader():
+    # Whisper and the embedding model load concurrently
+    loader = ServiceLoader()
+    loader.submit("speech", load_stt)
+    loader.submit("embedding", load_rag)
+    return loader
+
+def get_stt_session(create=False, language="zh"):
+    """
+    This browser session's recorder, or None while the Whisper model is loading.
+    With the shared engine, the session exists only while recording: it is
+    created by Start Recording (`create`) and closed by Stop Recording.
+    """
+    loader = get_service_loader()
+    if not loader.ready("speech"):
+        return None
+    stt = loader.get("speech")
+    if os.getenv("STT_SHARED_ENGINE") != "1":
+        return stt
+    # Each browser session records into its own queue, language and latency stats
+    if st.session_state.get("stt_session") is None and create:
+        st.session_state.stt_session = stt.create_session(language=language)
+    return st.session_state.get("stt_session")
+
+def close_stt_session():
+    """Releases the shared-engine session (and its audio buffer) after a recording."""
+    session = st.session_state.get("stt_session")
+    if session is not None:
+        get_service_loader().get("speech").close_session(session.session_id)
+        st.session_state.stt_session = None
 
-@st.cache_resource
 def get_rag_service():
-    return RAGService()
+    """The RAG service, or None while the embedding model is loading."""
+    loader = get_service_loader()
+    return loader.get("embedding") if loader.ready("embedding") else None
 
 @st.cache_resource
 def get_llm_service():
+    from llm_service import LLMService
     return LLMService()
 
-stt_service = get_stt_service()
+@st.cache_resource
+def get_context_builder():
+    # Smallest context that answers: MMR-deduplicated hits plus adjacent segments
+    return ContextBuilder(get_service_loader().get("embedding"), token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500")))
+
+@st.cache_resource
+def get_projection_engine():
+    # scikit-learn is only needed by the Knowledge Map
+    from projection import ProjectionEngine
+    return ProjectionEngine(get_service_loader().get("embedding"))
+
+@st.cache_resource
+def start_metrics_exporters():
+    # Optional JSON-lines / Prometheus export, configured via METRICS_* env vars
+    start_exporters_from_env()
+    return True
+
+start_metrics_exporters()
+loader = get_service_loader()
+stt_service = get_stt_session()
 rag_service = get_rag_service()
 llm_service = get_llm_service()
 
 st.title("Real-time Meeting RAG Agent")
 
 # Session State Initialization
+if "transcript_store" not in st.session_state:
+    # Lines of the current recording: a bounded live window in memory, all of them on disk
+    st.session_state.transcript_store = TranscriptStore(uuid.uuid4().hex)
 if "transcripts" not in st.session_state:
+    # Review copy, loaded from the store after Stop
     # Structure: [{"id": 0, "text": "...", "do_save": True}, ...]
     st.session_state.transcripts = []
 if "is_recording" not in st.session_state:
@@ -44,6 +115,25 @@ if "minutes" not in st.session_state:
     st.session_state.minutes = ""
 if "is_refined" not in st.session_state:
     st.session_state.is_refined = False
+if "refiner" not in st.session_state:
+    # Background refinement of the current recording (None when not running)
+    st.session_state.refiner = None
+if "answer_cancel" not in st.session_state:
+    # Cancels the answer still streaming when a new question comes in
+    st.session_state.answer_cancel = None
+if "meeting_id" not in st.session_state:
+    # Identifies the current (or last saved) meeting in the knowledge base
+    st.session_state.meeting_id = None
+
+def drain_transcripts():
+    """Moves committed lines from the STT queue into the store (and the live refiner)."""
+    if hasattr(stt_service, "touch"):
+        # Keeps the shared-engine session from being expired as abandoned
+        stt_service.touch()
+    while not stt_service.transcript_queue.empty():
+        row = st.session_state.transcript_store.append(stt_service.transcript_queue.get())
+        if st.session_state.refiner is not None:
+            st.session_state.refiner.add(row["id"], row["text"])
 
 # Sidebar for controls
 with st.sidebar:
@@ -70,36 +160,88 @@ with st.sidebar:
     selected_lang_code = LANGUAGES[selected_lang_name]
     
     # Update STT Service language
-    if stt_service.language != selected_lang_code:
+    if stt_service is not None and stt_service.language != selected_lang_code:
         stt_service.set_language(selected_lang_code)
 
-    if st.button("Start Recording"):
+    live_refine = st.checkbox(
+        "Refine while recording",
+        value=True,
+        help="Refine finished segments against the agenda in the background during the meeting.",
+    )
+    if st.session_state.refiner is not None:
+        st.session_state.refiner.agenda = st.session_state.agenda
+
+    if st.button("Start Recording", disabled=not loader.ready("speech")):
         if not st.session_state.is_recording:
+            stt_service = get_stt_session(create=True, language=selected_lang_code)
+            if st.session_state.refiner is not None:
+                # Left over from a recording that was never stopped
+                st.session_state.refiner.cancel()
+                st.session_state.refiner = None
+            if live_refine and st.session_state.agenda:
+                st.session_state.refiner = BackgroundRefiner(
+                    llm_service, st.session_state.agenda, stt_service=stt_service
+                )
             stt_service.start_recording()
             st.session_state.is_recording = True
+            st.session_state.meeting_id = datetime.datetime.now().strftime("meeting-%Y%m%d-%H%M%S")
             st.success("Recording started!")
             st.rerun()
 
     if st.button("Stop Recording"):
-        if st.session_state.is_recording:
+        if st.session_state.is_recording and stt_service is not None:
             stt_service.stop_recording()
             st.session_state.is_recording = False
             
+            # Segments committed while stopping are refined with the rest
+            drain_transcripts()
+            close_stt_session()
+            st.session_state.transcripts = st.session_state.transcript_store.all()
+
             # Auto-Refine if Agenda exists
             if st.session_state.agenda and not st.session_state.is_refined:
                 with st.spinner("AI is refining transcripts based on agenda..."):
-                    refined = llm_service.refine_transcript(st.session_state.agenda, st.session_state.transcripts)
+                    if st.session_state.refiner is not None:
+                        # Most segments were refined during the meeting; finish the rest
+                        refined_by_id = st.session_state.refiner.finish()
+                        refined = [{"id": k, "text": v} for k, v in refined_by_id.items()]
+                        st.session_state.refiner = None
+                    else:
+                        refined = llm_service.refine_transcript(st.session_state.agenda, st.session_state.transcripts)
                     # Update transcripts
                     id_map = {r['id']: r['text'] for r in refined}
                     for t in st.session_state.transcripts:
                         if t['id'] in id_map:
                             t['text'] = id_map[t['id']]
+                    st.session_state.transcript_store.update_texts(id_map)
                     st.session_state.is_refined = True
                     st.success("Transcripts refined by AI!")
 
             st.warning("Recording stopped! Please review transcripts.")
             st.rerun()
 
+    if not loader.done():
+        # Polls until every model has loaded, then reruns the page to enable the controls
+        @st.fragment(run_every=1)
+        def warmup_status():
+            if loader.done():
+                st.rerun()
+            for name, status in loader.status().items():
+                st.caption(f"Loading {name} model... {status['seconds']:.0f}s" if status["state"] == "loading"
+                           else f"{name} model {status['state']}")
+        warmup_status()
+    for name, status in loader.status().items():
+        if status["state"] == "failed":
+            st.error(f"Failed to load the {name} model: {status['error']}")
+
+    with st.expander("Performance Metrics"):
+        st.caption("Startup")
+        st.json(loader.status())
+        if stt_service is not None and hasattr(stt_service, "stats"):
+            st.caption("This session's transcription")
+            st.json(stt_service.stats())
+        st.json(metrics.snapshot())
+
 # Main Layout
 tab1, tab2 = st.tabs(["Live Meeting", "Knowledge Map"])
 
@@ -109,33 +251,33 @@ with tab1:
     with col1:
         st.subheader("Live Transcript")
         
-        # Process new transcripts from Queue
-        while not stt_service.transcript_queue.empty():
-            text = stt_service.transcript_queue.get()
-            # Append new transcript as a dict for the data editor
-            new_id = len(st.session_state.transcripts)
-            st.session_state.transcripts.append({"id": new_id, "text": text, "do_save": True})
-            
         if st.session_state.is_recording:
-            # Read-only view during recording
-            transcript_container = st.container()
-            with transcript_container:
-                if not st.session_state.transcripts:
+            # Only this panel refreshes every second, not the whole script
+            @st.fragment(run_every=1)
+            def live_transcript():
+                drain_transcripts()
+                store = st.session_state.transcript_store
+                if not len(store):
                     st.info("Listening...")
                 
                 # Only show the last 10 transcripts to avoid performance issues and WebSocket crashes
-                recent_transcripts = st.session_state.transcripts[-10:]
-                if len(st.session_state.transcripts) > 10:
-                    st.text(f"... (Previous {len(st.session_state.transcripts) - 10} lines hidden) ...")
+                recent_transcripts = store.recent(10)
+                if len(store) > 10:
+                    st.text(f"... (Previous {len(store) - 10} lines hidden) ...")
                 
+                refined_live = st.session_state.refiner.refined if st.session_state.refiner else {}
                 for t in recent_transcripts:
-                    # Handle legacy string format if any, though we initialized as list of dicts
-                    text_content = t["text"] if isinstance(t, dict) else t
+                    text_content = t["text"]
+                    if t["id"] in refined_live:
+                        text_content = f"{refined_live[t['id']]} ✓"
                     st.write(f"- {text_content}")
-            
-            # Auto-refresh mechanism
-            time.sleep(1)
-            st.rerun()
+
+                # Provisional text from the streaming decoder (not yet committed)
+                if stt_service.partial_text:
+                    st.caption(f"… {stt_service.partial_text}")
+
+            # Read-only view during recording
+            live_transcript()
             
         else:
             # Review Mode: Editable Dataframe
@@ -154,7 +296,7 @@ with tab1:
                 )
                 
                 # Save Button
-                if st.button("Save & Generate Minutes", type="primary"):
+                if st.button("Save & Generate Minutes", type="primary", disabled=rag_service is None):
                     # Filter transcripts
                     final_transcripts = [
                         row for row in edited_df 
@@ -163,20 +305,27 @@ with tab1:
                     final_texts = [t["text"] for t in final_transcripts]
                     
                     if final_texts:
-                        with st.spinner("Saving to Vector Database & Generating Minutes..."):
-                            # 1. Save to RAG
-                            rag_service.batch_add_transcripts(final_texts)
-                            
-                            # 2. Generate Minutes
-                            if st.session_state.agenda:
-                                minutes = llm_service.generate_minutes(st.session_state.agenda, final_transcripts)
-                                st.session_state.minutes = minutes
-                            else:
-                                st.session_state.minutes = "No agenda provided. Minutes generation skipped."
+                        # 1. Save to RAG (stored in the background)
+                        rag_service.enqueue_transcripts(
+                            final_texts,
+                            payloads=[{"seq": t["id"]} for t in final_transcripts],
+                            meeting_id=st.session_state.meeting_id,
+                            language=selected_lang_code,
+                        )
+                        
+                        # 2. Generate Minutes, rendered as they are written
+                        if st.session_state.agenda:
+                            st.subheader("Meeting Minutes")
+                            st.session_state.minutes = st.write_stream(
+                                llm_service.stream_minutes(st.session_state.agenda, final_transcripts)
+                            )
+                        else:
+                            st.session_state.minutes = "No agenda provided. Minutes generation skipped."
 
                         st.success(f"Saved {len(final_texts)} sentences to Knowledge Base!")
                         # Clear transcripts after saving
                         st.session_state.transcripts = []
+                        st.session_state.transcript_store.clear()
                         st.session_state.is_refined = False # Reset for next time
                         st.rerun()
                     else:
@@ -193,41 +342,66 @@ with tab1:
 
     with col2:
         st.subheader("AI Assistant")
+        this_meeting_only = st.checkbox(
+            "Only search this meeting",
+            value=False,
+            disabled=st.session_state.meeting_id is None,
+        )
         
         # Chat Interface
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
 
-        if prompt := st.chat_input("Ask about the meeting..."):
+        if prompt := st.chat_input(
+            "Ask about the meeting..." if rag_service is not None else "Loading the embedding model...",
+            disabled=rag_service is None,
+        ):
             st.session_state.messages.append({"role": "user", "content": prompt})
             with st.chat_message("user"):
                 st.markdown(prompt)
 
             with st.chat_message("assistant"):
                 # RAG Query
-                context_results = rag_service.query(prompt)
-                context_text = "\n".join(context_results)
+                scope = {"meeting_id": st.session_state.meeting_id} if this_meeting_only else {}
+                context_text = get_context_builder().build(prompt, **scope)
                 
-                # Use Gemini to answer
-                with st.spinner("Thinking..."):
-                    response = llm_service.answer_question(context_text, prompt)
-            
-                st.markdown(response)
-                st.session_state.messages.append({"role": "assistant", "content": response})
+                # Stream the answer; a newer question stops an older stream
+                if st.session_state.answer_cancel is not None:
+                    st.session_state.answer_cancel.set()
+                cancel = threading.Event()
+                st.session_state.answer_cancel = cancel
+                # Recorded as it streams: a newer question stops this run inside
+                # write_stream, and the partial answer stays in the history
+                message = {"role": "assistant", "content": ""}
+                st.session_state.messages.append(message)
+
+                def answer_chunks():
+                    for chunk in llm_service.stream_answer(context_text, prompt, cancel_event=cancel):
+                        message["content"] += chunk
+                        yield chunk
+
+                try:
+                    st.write_stream(answer_chunks())
+                finally:
+                    if not message["content"]:
+                        st.session_state.messages.remove(message)
 
 with tab2:
     st.subheader("Semantic Knowledge Map")
-    if st.button("Refresh Map"):
-        # Increased limit to visualize more history
-        points = rag_service.get_all_vectors(limit=1000)
-        if len(points) > 2:
-            vectors = [p.vector for p in points]
-            texts = [p.payload.get("text", "") for p in points]
-            
-            # Reduce dimensions to 3D using PCA for better visualization
-            pca = PCA(n_components=3)
-            vectors_3d = pca.fit_transform(vectors)
+    if st.button("Refresh Map", disabled=rag_service is None):
+        # Plotting libraries are only imported once a map is requested
+        import pandas as pd
+        import plotly.express as px
+
+        # Incremental PCA over the whole collection; only new points are projected
+        projection = get_projection_engine()
+        with st.spinner("Updating projection..."):
+            projection.refresh()
+        if len(projection) > 2:
+            vectors_3d, texts = projection.display_points()
+            if len(projection) > len(texts):
+                st.caption(f"Showing a sample of {len(texts)} of {len(projection)} points.")
             
             df = pd.DataFrame(vectors_3d, columns=["x", "y", "z"])
             df["text"] = texts
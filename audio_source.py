@@ -0,0 +1,234 @@
+import threading
+import time
+import wave
+import numpy as np
+from metrics import metrics
+
+SAMPLE_RATE = 16000
+
+class AudioRingBuffer:
+    def __init__(self, capacity):
+        """
+        Preallocated float32 ring buffer for mono 16 kHz audio.
+
+        The storage is mirrored (every sample is written at i and i + capacity), so any
+        window of up to `capacity` samples can be handed out as a contiguous, zero-copy
+        view. Positions are absolute sample indices since the buffer was created.
+        """
+        self.capacity = int(capacity)
+        self._data = np.zeros(2 * self.capacity, dtype=np.float32)
+        self.total_written = 0
+
+    @property
+    def oldest(self):
+        """Absolute index of the oldest sample still held in the buffer."""
+        return max(0, self.total_written - self.capacity)
+
+    def write(self, samples):
+        """
+        Writes int16 PCM or float32 samples, converting in place (no temporaries).
+        Only one thread may write.
+        """
+        n = len(samples)
+        if n == 0:
+            return
+        if n > self.capacity:
+            self.total_written += n - self.capacity
+            samples = samples[-self.capacity:]
+            n = self.capacity
+
+        pos = self.total_written % self.capacity
+        first = min(n, self.capacity - pos)
+        self._store(pos, samples[:first])
+        if first < n:
+            self._store(0, samples[first:])
+        self.total_written += n
+
+    def _store(self, pos, samples):
+        n = len(samples)
+        for offset in (pos, pos + self.capacity):
+            out = self._data[offset:offset + n]
+            if samples.dtype == np.int16:
+                # 16-bit PCM is signed integer, so we divide by 32768
+                np.multiply(samples, 1.0 / 32768.0, out=out, casting="unsafe")
+            else:
+                out[:] = samples
+
+    def view(self, start, end):
+        """
+        Returns a read-only view of samples [start, end). `start` must not be older
+        than `oldest`; the view stays valid until the writer laps it.
+        """
+        if start < self.oldest or end > self.total_written or end - start > self.capacity:
+            raise ValueError(f"Window [{start}, {end}) is outside the buffer")
+        offset = start % self.capacity
+        view = self._data[offset:offset + (end - start)]
+        view.flags.writeable = False
+        return view
+
+
+class AudioSource:
+    """
+    Base class for audio inputs. A source delivers mono 16 kHz samples (int16 or
+    float32 numpy arrays) to the callback passed to `start` until `stop` is called
+    or, for finite sources, until `finished` becomes True.
+    """
+    sample_rate = SAMPLE_RATE
+
+    def start(self, callback):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    @property
+    def finished(self):
+        return False
+
+
+class MicrophoneSource(AudioSource):
+    def __init__(self, frames_per_buffer=1024, device_index=None):
+        self.frames_per_buffer = frames_per_buffer
+        self.device_index = device_index
+        self.overflows = 0
+        self._pyaudio = None
+        self._stream = None
+
+    def start(self, callback):
+        import pyaudio
+
+        def on_frames(in_data, frame_count, time_info, status):
+            if status & pyaudio.paInputOverflow:
+                self.overflows += 1
+                metrics.inc("stt_input_overflows_total")
+            # np.frombuffer is a view on PyAudio's bytes; the ring buffer converts in place
+            callback(np.frombuffer(in_data, dtype=np.int16))
+            return (None, pyaudio.paContinue)
+
+        self._pyaudio = pyaudio.PyAudio()
+        try:
+            self._stream = self._pyaudio.open(format=pyaudio.paInt16,
+                                              channels=1,
+                                              rate=self.sample_rate,
+                                              input=True,
+                                              input_device_index=self.device_index,
+                                              frames_per_buffer=self.frames_per_buffer,
+                                              stream_callback=on_frames)
+        except Exception:
+            self._pyaudio.terminate()
+            self._pyaudio = None
+            raise
+        self._stream.start_stream()
+
+    def stop(self):
+        if self._stream:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pyaudio:
+            self._pyaudio.terminate()
+            self._pyaudio = None
+
+
+class _ThreadedSource(AudioSource):
+    """
+    Feeds blocks from `_blocks()` to the callback on a background thread, optionally
+    paced to real time so the rest of the pipeline sees microphone-like timing.
+    """
+    def __init__(self, realtime=True, block_frames=1024):
+        self.realtime = realtime
+        self.block_frames = block_frames
+        self._running = False
+        self._done = threading.Event()
+        self._thread = None
+
+    def _blocks(self):
+        raise NotImplementedError
+
+    def start(self, callback):
+        self._running = True
+        self._done.clear()
+        self._thread = threading.Thread(target=self._run, args=(callback,), daemon=True)
+        self._thread.start()
+
+    def _run(self, callback):
+        started = time.perf_counter()
+        delivered = 0
+        try:
+            for block in self._blocks():
+                if not self._running:
+                    break
+                callback(block)
+                delivered += len(block)
+                if self.realtime:
+                    ahead = delivered / self.sample_rate - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        finally:
+            self._done.set()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+
+class WavFileSource(_ThreadedSource):
+    def __init__(self, path, realtime=True, block_frames=1024):
+        """
+        Replays a PCM WAV file. Stereo is downmixed and other sample rates are
+        resampled to 16 kHz.
+        """
+        super().__init__(realtime=realtime, block_frames=block_frames)
+        self.path = path
+
+    def _blocks(self):
+        with wave.open(str(self.path), "rb") as wav:
+            channels = wav.getnchannels()
+            rate = wav.getframerate()
+            if wav.getsampwidth() != 2:
+                raise ValueError(f"{self.path}: only 16-bit PCM WAV is supported")
+            # Read in source-rate blocks that come out as ~block_frames after resampling
+            read_frames = max(1, int(self.block_frames * rate / self.sample_rate))
+            while True:
+                data = wav.readframes(read_frames)
+                if not data:
+                    break
+                block = np.frombuffer(data, dtype=np.int16)
+                if channels > 1:
+                    block = block.reshape(-1, channels).mean(axis=1).astype(np.int16)
+                if rate != self.sample_rate:
+                    n_out = int(round(len(block) * self.sample_rate / rate))
+                    block = np.interp(np.linspace(0, len(block) - 1, n_out),
+                                      np.arange(len(block)), block).astype(np.int16)
+                yield block
+
+
+class SyntheticSource(_ThreadedSource):
+    def __init__(self, samples=None, seconds=10.0, realtime=True, block_frames=1024, seed=0):
+        """
+        Replays `samples` (int16 or float32 at 16 kHz) or, if None, generates
+        `seconds` of deterministic tone bursts over low noise.
+        """
+        super().__init__(realtime=realtime, block_frames=block_frames)
+        if samples is None:
+            samples = self._generate(seconds, seed)
+        self.samples = np.asarray(samples)
+
+    def _generate(self, seconds, seed):
+        rng = np.random.default_rng(seed)
+        n = int(seconds * self.sample_rate)
+        t = np.arange(n) / self.sample_rate
+        # 1.5 s bursts of a 220 Hz tone every 2.5 s
+        envelope = ((t % 2.5) < 1.5).astype(np.float32)
+        audio = 0.3 * np.sin(2 * np.pi * 220 * t) * envelope + 0.01 * rng.standard_normal(n)
+        return audio.astype(np.float32)
+
+    def _blocks(self):
+        for i in range(0, len(self.samples), self.block_frames):
+            yield self.samples[i:i + self.block_frames]
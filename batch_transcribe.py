@@ -0,0 +1,236 @@
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from faster_whisper import BatchedInferencePipeline, WhisperModel, decode_audio
+
+AUDIO_EXTENSIONS = (".wav", ".flac")
+SAMPLE_RATE = 16000
+# Namespace for deterministic point ids, so a re-run overwrites instead of duplicating
+POINT_NAMESPACE = uuid.UUID("6f1c2a4e-6a8e-4d8b-9c1e-3b5d7e2f9a10")
+
+
+class BatchTranscriber:
+    def __init__(self, rag_service, model_size="small", device="cpu", compute_type="int8",
+                 language=None, workers=2, batch_size=8, beam_size=1, flush_size=64,
+                 cpu_threads=0):
+        """
+        Offline transcription of recorded meetings.
+
+        Files are decoded, split on VAD speech boundaries and decoded in batches by
+        faster-whisper's BatchedInferencePipeline. `workers` files are processed
+        concurrently against one model (ctranslate2 runs `workers` decodes in
+        parallel). Segments are streamed through a single writer thread into
+        `rag_service.batch_add_transcripts` in groups of `flush_size`.
+        """
+        self.rag_service = rag_service
+        self.language = language
+        self.workers = workers
+        self.batch_size = batch_size
+        self.beam_size = beam_size
+        self.flush_size = flush_size
+        print(f"Loading Whisper model: {model_size} on {device} with {compute_type} ({workers} workers)...")
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type,
+                                  num_workers=workers, cpu_threads=cpu_threads,
+                                  download_root=os.getenv("MODEL_CACHE_DIR", "./model_cache"))
+        self.pipeline = BatchedInferencePipeline(model=self.model)
+        print("Model loaded.")
+
+    def run(self, input_dir, manifest_path=None):
+        """
+        Transcribes every WAV/FLAC file under `input_dir` and ingests the segments.
+        Files already recorded in the manifest (same size and mtime) are skipped, so
+        an interrupted run resumes where it stopped. Returns a summary dict.
+        """
+        input_dir = Path(input_dir)
+        manifest_path = Path(manifest_path or input_dir / ".batch_manifest.jsonl")
+        done = self._load_manifest(manifest_path)
+
+        files = sorted(p for p in input_dir.rglob("*") if p.suffix.lower() in AUDIO_EXTENSIONS)
+        pending = [p for p in files if done.get(self._file_key(input_dir, p)) != self._fingerprint(p)]
+        print(f"Found {len(files)} audio files, {len(files) - len(pending)} already done, {len(pending)} to process.")
+
+        writes = queue.Queue(maxsize=self.workers * 4)
+        self._failed_writes = set()
+        writer = threading.Thread(target=self._write_loop, args=(writes,))
+        writer.start()
+
+        started = time.perf_counter()
+        total_audio = 0.0
+        total_segments = 0
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self._transcribe_file, input_dir, path, writes): path for path in pending}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        print(f"Error transcribing {path}: {e}")
+                        failed.append(str(path))
+                        continue
+                    # Only mark the file done once all its segments are stored
+                    record["flushed"].wait()
+                    del record["flushed"]
+                    if record["file"] in self._failed_writes:
+                        failed.append(str(path))
+                        continue
+                    self._append_manifest(manifest_path, record)
+                    total_audio += record["duration"]
+                    total_segments += record["segments"]
+                    print(f"{record['file']}: {record['segments']} segments, "
+                          f"{record['duration']:.0f}s audio, RTF {record['rtf']:.3f}")
+        finally:
+            writes.put(None)
+            writer.join()
+
+        elapsed = time.perf_counter() - started
+        summary = {
+            "files": len(pending) - len(failed),
+            "failed": failed,
+            "segments": total_segments,
+            "audio_seconds": total_audio,
+            "wall_seconds": elapsed,
+            # RTF < 1 is faster than real time; speedup = audio hours per wall-clock hour
+            "rtf": elapsed / total_audio if total_audio else 0.0,
+            "speedup": total_audio / elapsed if elapsed else 0.0,
+        }
+        print(f"Processed {summary['audio_seconds'] / 3600:.2f}h of audio in {elapsed:.0f}s "
+              f"(RTF {summary['rtf']:.3f}, {summary['speedup']:.1f}x real time).")
+        return summary
+
+    def _transcribe_file(self, input_dir, path, writes):
+        started = time.perf_counter()
+        key = self._file_key(input_dir, path)
+        audio = decode_audio(str(path), sampling_rate=SAMPLE_RATE)
+        duration = len(audio) / SAMPLE_RATE
+
+        segments, info = self.pipeline.transcribe(
+            audio,
+            language=self.language,
+            batch_size=self.batch_size,
+            beam_size=self.beam_size,
+            vad_filter=True,
+        )
+
+        texts, payloads, ids = [], [], []
+        count = 0
+        for segment in segments:
+            text = segment.text.strip()
+            if not text:
+                continue
+            texts.append(text)
+            payloads.append({
+                "meeting_id": key,
+                "seq": count,
+                "source_file": key,
+                "audio_start": round(segment.start, 2),
+                "audio_end": round(segment.end, 2),
+                "language": info.language,
+            })
+            ids.append(str(uuid.uuid5(POINT_NAMESPACE, f"{key}:{segment.start:.2f}")))
+            count += 1
+            if len(texts) >= self.flush_size:
+                writes.put((key, texts, payloads, ids, None))
+                texts, payloads, ids = [], [], []
+
+        flushed = threading.Event()
+        writes.put((key, texts, payloads, ids, flushed))
+        elapsed = time.perf_counter() - started
+        return {
+            "file": key,
+            "fingerprint": self._fingerprint(path),
+            "duration": duration,
+            "segments": count,
+            "rtf": elapsed / duration if duration else 0.0,
+            "flushed": flushed,
+        }
+
+    def _write_loop(self, writes):
+        while True:
+            item = writes.get()
+            if item is None:
+                break
+            key, texts, payloads, ids, flushed = item
+            try:
+                if texts:
+                    self.rag_service.batch_add_transcripts(texts, payloads=payloads, ids=ids)
+            except Exception as e:
+                print(f"Error storing segments from {key}: {e}")
+                self._failed_writes.add(key)
+            if flushed:
+                flushed.set()
+
+    @staticmethod
+    def _file_key(input_dir, path):
+        return str(path.relative_to(input_dir))
+
+    @staticmethod
+    def _fingerprint(path):
+        stat = path.stat()
+        return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+    @staticmethod
+    def _load_manifest(manifest_path):
+        done = {}
+        if manifest_path.exists():
+            with open(manifest_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Torn last line from a crash
+                        continue
+                    done[record["file"]] = record["fingerprint"]
+        return done
+
+    @staticmethod
+    def _append_manifest(manifest_path, record):
+        with open(manifest_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-transcribe recorded meetings into the RAG store.")
+    parser.add_argument("input_dir", help="Directory containing .wav/.flac recordings")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--language", default=None, help="e.g. zh, en, ja, ko (default: auto-detect)")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--beam-size", type=int, default=1)
+    parser.add_argument("--cpu-threads", type=int, default=0)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--manifest", default=None, help="Resume manifest (default: <input_dir>/.batch_manifest.jsonl)")
+    parser.add_argument("--summary", default=None, help="Write the run summary as JSON to this path")
+    args = parser.parse_args()
+
+    from rag_service import RAGService
+
+    transcriber = BatchTranscriber(
+        RAGService(),
+        model_size=args.model,
+        device=args.device,
+        compute_type=args.compute_type,
+        language=args.language,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        beam_size=args.beam_size,
+        cpu_threads=args.cpu_threads,
+    )
+    summary = transcriber.run(args.input_dir, manifest_path=args.manifest)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import json
+import os
+import resource
+import sys
+import numpy as np
+
+# Benchmarks are run as scripts from the repo root: `python benchmarks/<name>.py`
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def percentiles(values, unit="ms"):
+    """
+    Returns p50/p95/p99 and mean of `values` in milliseconds (values are seconds).
+    `unit=None` reports the values as they are (e.g. real-time factors), without
+    a suffix on the keys.
+    """
+    suffix = f"_{unit}" if unit else ""
+    keys = [f"p50{suffix}", f"p95{suffix}", f"p99{suffix}", f"mean{suffix}"]
+    if not len(values):
+        return dict.fromkeys(keys)
+    scaled = np.asarray(values, dtype=np.float64) * (1000 if unit == "ms" else 1)
+    p50, p95, p99 = np.percentile(scaled, [50, 95, 99])
+    return dict(zip(keys, (round(float(v), 3) for v in (p50, p95, p99, scaled.mean()))))
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (Linux /proc, else the peak)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_corpus_lines():
+    """Non-empty lines of the sample meetings under testdata/."""
+    lines = []
+    testdata = os.path.join(REPO_ROOT, "testdata")
+    for name in sorted(os.listdir(testdata)):
+        with open(os.path.join(testdata, name), encoding="utf-8") as f:
+            lines.extend(line.strip(" #*-\t\n") for line in f)
+    return [line for line in lines if len(line) > 4]
+
+
+def write_report(report, path=None):
+    """Prints the report as JSON and optionally writes it to `path`."""
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
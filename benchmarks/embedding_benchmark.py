@@ -0,0 +1,182 @@
+"""
+Embedding backend and vector quantization benchmark.
+
+Measures encode throughput, model memory and recall@k of each embedding backend
+against the float32 PyTorch baseline, then query latency and recall@k of Qdrant
+collections stored without quantization, with scalar (int8) and with binary
+quantization (with rescoring).
+
+    python benchmarks/embedding_benchmark.py --corpus-size 5000 --output embedding_bench.json
+
+Local (embedded) Qdrant ignores quantization settings, so storage numbers are only
+meaningful with --qdrant-url pointing at a server; the bytes per vector are reported
+either way.
+"""
+import argparse
+import gc
+import time
+import uuid
+import numpy as np
+
+from bench_utils import current_rss_mb, load_corpus_lines, percentiles, write_report
+from embedding_backends import EMBEDDING_BACKENDS, load_encoder
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+from rag_service import quantization_config, quantization_search_params
+
+
+def build_corpus(size, queries, seed=0):
+    """Sample meeting lines plus shuffled two-line combinations up to `size` texts."""
+    rng = np.random.default_rng(seed)
+    lines = load_corpus_lines()
+    corpus = list(lines)
+    while len(corpus) < size:
+        a, b = rng.choice(len(lines), 2, replace=False)
+        corpus.append(f"{lines[a]} {lines[b]}")
+    corpus = corpus[:size]
+    # Queries are trimmed lines, so the nearest neighbours are not exact copies
+    picks = rng.choice(len(lines), min(queries, len(lines)), replace=False)
+    query_texts = [lines[i][: max(4, int(len(lines[i]) * 0.7))] for i in picks]
+    return corpus, query_texts
+
+
+def exact_top_k(corpus_vectors, query_vectors, k):
+    scores = query_vectors @ corpus_vectors.T
+    top = np.argpartition(-scores, min(k, scores.shape[1] - 1), axis=1)[:, :k]
+    return [set(row) for row in top]
+
+
+def recall_at_k(truth, found):
+    k = len(truth[0])
+    return round(float(np.mean([len(t & f) / k for t, f in zip(truth, found)])), 4)
+
+
+def encode(encoder, texts, batch_size):
+    return np.asarray(
+        encoder.encode(texts, batch_size=batch_size, normalize_embeddings=True, show_progress_bar=False),
+        dtype=np.float32,
+    )
+
+
+def bench_backends(args, corpus, queries):
+    results = {}
+    truth = None
+    for backend in args.backends:
+        gc.collect()
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        encoder = load_encoder(args.model, backend=backend)
+        load_seconds = time.perf_counter() - start
+        rss_model = current_rss_mb() - rss_before
+
+        encode(encoder, corpus[: args.batch_size], args.batch_size)  # warm-up
+        start = time.perf_counter()
+        corpus_vectors = encode(encoder, corpus, args.batch_size)
+        encode_seconds = time.perf_counter() - start
+
+        latencies = []
+        query_vectors = []
+        for text in queries:
+            start = time.perf_counter()
+            query_vectors.append(encode(encoder, [text], 1)[0])
+            latencies.append(time.perf_counter() - start)
+        query_vectors = np.asarray(query_vectors)
+
+        found = exact_top_k(corpus_vectors, query_vectors, args.k)
+        if truth is None:
+            # The first backend (torch by default) is the float32 reference
+            truth = found
+            reference = backend
+        results[backend] = {
+            "load_seconds": round(load_seconds, 2),
+            "model_rss_mb": round(rss_model, 1),
+            "encode_texts_per_second": round(len(corpus) / encode_seconds, 1),
+            "query_encode_latency": percentiles(latencies),
+            f"recall@{args.k}_vs_{reference}": recall_at_k(truth, found),
+        }
+        print(f"{backend}: {results[backend]}")
+        if backend == args.backends[0]:
+            vectors = (corpus_vectors, query_vectors)
+        del encoder
+    return results, vectors
+
+
+def bench_storage(args, corpus_vectors, query_vectors):
+    client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(":memory:")
+    truth = exact_top_k(corpus_vectors, query_vectors, args.k)
+    dim = corpus_vectors.shape[1]
+    bytes_per_vector = {"none": dim * 4, "scalar": dim, "binary": dim // 8}
+    results = {}
+    for quantization in args.quantizations:
+        name = f"embedding_bench_{quantization}_{uuid.uuid4().hex[:8]}"
+        # Same settings RAGService uses, so the numbers match what the app creates
+        kind = None if quantization == "none" else quantization
+        search_params = quantization_search_params(kind, args.oversampling)
+        client.create_collection(
+            collection_name=name,
+            vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+            quantization_config=quantization_config(kind),
+        )
+        try:
+            for i in range(0, len(corpus_vectors), 1000):
+                client.upsert(
+                    collection_name=name,
+                    points=[
+                        PointStruct(id=j, vector=corpus_vectors[j].tolist())
+                        for j in range(i, min(i + 1000, len(corpus_vectors)))
+                    ],
+                )
+            latencies = []
+            found = []
+            for vector in query_vectors:
+                start = time.perf_counter()
+                points = client.query_points(
+                    collection_name=name, query=vector.tolist(), limit=args.k, search_params=search_params
+                ).points
+                latencies.append(time.perf_counter() - start)
+                found.append({p.id for p in points})
+            results[quantization] = {
+                "bytes_per_vector": bytes_per_vector[quantization],
+                "query_latency": percentiles(latencies),
+                f"recall@{args.k}_vs_exact": recall_at_k(truth, found),
+            }
+            print(f"storage {quantization}: {results[quantization]}")
+        finally:
+            client.delete_collection(name)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends and vector quantization.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", default=",".join(b for b in EMBEDDING_BACKENDS if b != "hash"),
+                        help="Comma-separated; the first one is the recall reference")
+    parser.add_argument("--quantizations", default="none,scalar,binary")
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--oversampling", type=float, default=2.0)
+    parser.add_argument("--qdrant-url", default=None, help="Qdrant server; default is in-memory local mode")
+    parser.add_argument("--output", default=None, help="Also write the JSON report here")
+    args = parser.parse_args()
+    args.backends = args.backends.split(",")
+    args.quantizations = args.quantizations.split(",")
+
+    corpus, queries = build_corpus(args.corpus_size, args.queries)
+    print(f"Corpus: {len(corpus)} texts, {len(queries)} queries, k={args.k}")
+    backend_results, (corpus_vectors, query_vectors) = bench_backends(args, corpus, queries)
+    storage_results = bench_storage(args, corpus_vectors, query_vectors)
+    write_report({
+        "model": args.model,
+        "corpus_size": len(corpus),
+        "queries": len(queries),
+        "k": args.k,
+        "qdrant": args.qdrant_url or "local (quantization not applied)",
+        "backends": backend_results,
+        "storage": storage_results,
+    }, args.output)
+
+
+if __name__ == "__main__":
+    main()
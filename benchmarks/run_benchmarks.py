@@ -0,0 +1,368 @@
+"""
+Offline benchmark suite for the STT, RAG and LLM stages.
+
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --stages rag,llm --rag-scales 10000,100000 --baseline bench.json
+    python benchmarks/run_benchmarks.py --compare old.json new.json
+
+Nothing needs a microphone, a network or an API key:
+- STT replays WAV fixtures through STTService (tone-burst fixtures are generated
+  unless --wav is given) and reports real-time factor, decode time and queue wait.
+  The Whisper model must already be in MODEL_CACHE_DIR (or --whisper-model is a
+  local model directory); otherwise the stage is reported as skipped.
+- RAG ingests synthetic transcripts built from testdata/ into a fresh RAGService
+  at each scale, embedded with the model-free "hash" backend, then times dense,
+  lexical and hybrid queries.
+- LLM runs LLMService against fake_llm_server with configurable latency.
+
+Latencies are reported as p50/p95/p99/mean in ms, throughput as *_per_second,
+plus resident and peak memory. --compare (or --baseline for the fresh run)
+prints the change of every latency and throughput figure and exits with status 1
+when one regressed by more than --threshold percent.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from bench_utils import current_rss_mb, load_corpus_lines, peak_rss_mb, percentiles, write_report
+from metrics import metrics
+
+STAGES = ("stt", "rag", "llm")
+RAG_MODES = ("dense", "lexical", "hybrid")
+
+
+def timed(fn, *args, **kwargs):
+    """Returns (result, seconds)."""
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def synthetic_transcripts(count, seed=0):
+    """`count` distinct transcript lines made of two or three sample meeting lines."""
+    rng = np.random.default_rng(seed)
+    lines = load_corpus_lines()
+    texts = []
+    for _ in range(count):
+        picks = rng.choice(len(lines), rng.integers(2, 4), replace=False)
+        texts.append(" ".join(lines[i] for i in picks))
+    return texts
+
+
+def synthetic_queries(count, seed=1):
+    """Trimmed sample lines, so the best matches are not exact copies."""
+    rng = np.random.default_rng(seed)
+    lines = load_corpus_lines()
+    picks = rng.choice(len(lines), count, replace=len(lines) < count)
+    return [lines[i][: max(4, int(len(lines[i]) * 0.7))] for i in picks]
+
+
+# --- STT -------------------------------------------------------------------
+
+def write_wav_fixtures(directory, count, seconds):
+    """Writes `count` 16-bit mono WAV files of SyntheticSource audio. Returns their paths."""
+    from audio_source import SAMPLE_RATE, SyntheticSource
+
+    paths = []
+    for i in range(count):
+        samples = SyntheticSource(seconds=seconds, seed=i).samples
+        path = os.path.join(directory, f"synthetic-{i}.wav")
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes((np.clip(samples, -1, 1) * 32767).astype(np.int16).tobytes())
+        paths.append(path)
+    return paths
+
+
+def wav_seconds(path):
+    with wave.open(path, "rb") as wav:
+        return wav.getnframes() / wav.getframerate()
+
+
+def bench_stt(args, workdir):
+    from audio_source import WavFileSource
+    from stt_service import DegradationPolicy, STTService
+
+    paths = args.wav or write_wav_fixtures(workdir, args.stt_files, args.stt_seconds)
+    audio_seconds = sum(wav_seconds(p) for p in paths)
+    results = {"fixtures": [os.path.basename(p) for p in paths], "audio_seconds": round(audio_seconds, 3)}
+    for mode in args.stt_modes:
+        try:
+            # No fallback model, so only --whisper-model has to be cached
+            service = STTService(args.whisper_model, streaming=mode == "streaming", language=args.language,
+                                 policy=DegradationPolicy(fallback_model_size=None))
+        except Exception as e:
+            return {"skipped": f"Whisper model {args.whisper_model!r} could not be loaded: {e}"}
+
+        metrics.reset()
+        transcripts = 0
+        started = time.perf_counter()
+        for path in paths:
+            service.source = WavFileSource(path, realtime=not args.stt_fast)
+            service.start_recording()
+            service.wait()
+            while not service.transcript_queue.empty():
+                service.transcript_queue.get()
+                transcripts += 1
+        wall = time.perf_counter() - started
+        results[mode] = {
+            "wall_seconds": round(wall, 3),
+            "audio_seconds_per_second": round(audio_seconds / wall, 3),
+            "transcripts": transcripts,
+            "dropped_samples": service.dropped_samples,
+            "decode": percentiles(metrics.values("stt_decode_seconds")),
+            "queue_wait": percentiles(metrics.values("stt_queue_wait_seconds")),
+            "rtf": percentiles(metrics.values("stt_rtf"), unit=None),
+            "rss_mb": round(current_rss_mb(), 1),
+        }
+        del service
+    return results
+
+
+# --- RAG -------------------------------------------------------------------
+
+def bench_rag_scale(args, scale, workdir):
+    from rag_service import RAGService
+
+    path = os.path.join(workdir, f"qdrant-{scale}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        service = RAGService(collection_name=f"bench_{scale}", path=path, embedding_cache_path=None,
+                             url=args.qdrant_url, embedding_backend="hash")
+    texts = synthetic_transcripts(scale)
+    queries = synthetic_queries(args.queries)
+
+    batch_seconds = []
+    started = time.perf_counter()
+    # Ingest in the write queue's batch size; one synthetic meeting per 500 lines
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset in range(0, scale, args.batch_size):
+            batch = texts[offset:offset + args.batch_size]
+            payloads = [{"meeting_id": f"meeting-{(offset + i) // 500}", "seq": (offset + i) % 500}
+                        for i in range(len(batch))]
+            _, seconds = timed(service.batch_add_transcripts, batch, payloads=payloads, language="zh")
+            batch_seconds.append(seconds)
+    ingest_seconds = time.perf_counter() - started
+    stored = service.count()
+
+    result = {
+        "texts": scale,
+        "stored": stored,
+        "ingest": {
+            "seconds": round(ingest_seconds, 3),
+            "texts_per_second": round(scale / ingest_seconds, 1),
+            "batch_size": args.batch_size,
+            "batch": percentiles(batch_seconds),
+        },
+        "query": {},
+    }
+    for mode in RAG_MODES:
+        seconds = [timed(service.search, q, 5, mode)[1] for q in queries]
+        result["query"][mode] = {
+            "queries_per_second": round(len(seconds) / sum(seconds), 1),
+            "latency": percentiles(seconds),
+        }
+    # Filtered to one meeting, as "Only search this meeting" does
+    seconds = [timed(service.search, q, 5, "hybrid", meeting_id="meeting-0")[1] for q in queries]
+    result["query"]["hybrid_filtered"] = {
+        "queries_per_second": round(len(seconds) / sum(seconds), 1),
+        "latency": percentiles(seconds),
+    }
+    result["rss_mb"] = round(current_rss_mb(), 1)
+
+    service.ingest_queue.close()
+    if args.qdrant_url:
+        service.client.delete_collection(service.collection_name)
+    service.client.close()
+    return result
+
+
+def bench_rag(args, workdir):
+    return {str(scale): bench_rag_scale(args, scale, workdir) for scale in args.rag_scales}
+
+
+# --- LLM -------------------------------------------------------------------
+
+def bench_llm(args, workdir):
+    from fake_llm_server import serve_in_thread
+    from llm_backends import OpenAICompatibleBackend
+    from llm_cache import LLMCache
+    from llm_service import LLMService
+
+    server, base_url = serve_in_thread(latency=args.llm_latency, chunk_delay=args.llm_chunk_delay)
+    backend = OpenAICompatibleBackend(base_url=base_url, model="fake", max_concurrency=args.llm_concurrency)
+    service = LLMService(backend=backend, cache=LLMCache(os.path.join(workdir, "llm_cache.sqlite")))
+    service.use_cache = False
+
+    lines = load_corpus_lines()
+    context = "\n".join(f"- {line}" for line in lines[:20])
+    questions = synthetic_queries(args.llm_calls)
+    transcripts = [{"id": i, "text": text} for i, text in enumerate(synthetic_transcripts(args.llm_transcript_lines))]
+    agenda = "\n".join(f"{i + 1}. {line}" for i, line in enumerate(lines[:5]))
+    results = {"latency_seconds": args.llm_latency, "concurrency": args.llm_concurrency}
+
+    def answer_pass():
+        with ThreadPoolExecutor(args.llm_concurrency * 2) as pool:
+            started = time.perf_counter()
+            seconds = [s for _, s in pool.map(lambda q: timed(service.answer_question, context, q), questions)]
+        return seconds, time.perf_counter() - started
+
+    seconds, wall = answer_pass()
+    results["answer"] = {"calls_per_second": round(len(seconds) / wall, 2), "latency": percentiles(seconds)}
+
+    ttft, totals = [], []
+    for question in questions[: max(1, args.llm_calls // 4)]:
+        started = time.perf_counter()
+        first = None
+        for _ in service.stream_answer(context, question):
+            if first is None:
+                first = time.perf_counter() - started
+        ttft.append(first)
+        totals.append(time.perf_counter() - started)
+    results["stream_answer"] = {"ttft": percentiles(ttft), "total": percentiles(totals)}
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, seconds = timed(service.refine_transcript, agenda, transcripts)
+    results["refine"] = {"lines": len(transcripts), "seconds": round(seconds, 3),
+                         "lines_per_second": round(len(transcripts) / seconds, 1)}
+    _, seconds = timed(service.generate_minutes, agenda, transcripts)
+    results["minutes"] = {"lines": len(transcripts), "seconds": round(seconds, 3)}
+
+    # Repeated questions are answered from the cache
+    service.use_cache = True
+    answer_pass()
+    seconds, wall = answer_pass()
+    results["answer_cached"] = {"calls_per_second": round(len(seconds) / wall, 2), "latency": percentiles(seconds)}
+
+    server.shutdown()
+    return results
+
+
+# --- Compare ---------------------------------------------------------------
+
+def comparable_figures(report, prefix=""):
+    """
+    Flattens a report to {path: (value, higher_is_better)} for latency (*_ms)
+    and throughput (*_per_second) figures.
+    """
+    figures = {}
+    for key, value in report.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            figures.update(comparable_figures(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            if key.endswith("_ms"):
+                figures[path] = (value, False)
+            elif key.endswith("_per_second"):
+                figures[path] = (value, True)
+    return figures
+
+
+def compare_reports(old, new, threshold):
+    """
+    Returns [{"metric", "old", "new", "change_pct", "regression"}, ...] for the
+    figures present in both reports.
+    """
+    old_figures = comparable_figures(old)
+    rows = []
+    for path, (value, higher_is_better) in comparable_figures(new).items():
+        if path not in old_figures or not old_figures[path][0]:
+            continue
+        before = old_figures[path][0]
+        change = (value - before) / before * 100
+        worse = -change if higher_is_better else change
+        rows.append({
+            "metric": path,
+            "old": before,
+            "new": value,
+            "change_pct": round(change, 1),
+            "regression": worse > threshold,
+        })
+    return rows
+
+
+def load_report(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_comparison(rows):
+    for row in rows:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<60} {row['old']:>12} -> {row['new']:>12} ({row['change_pct']:+.1f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline STT / RAG / LLM benchmarks.")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--output", default=None, help="Also write the JSON report here")
+    parser.add_argument("--baseline", default=None, help="Compare this run against an earlier report")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), default=None,
+                        help="Only compare two existing reports")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    # STT
+    parser.add_argument("--whisper-model", default="tiny")
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--stt-modes", default="chunked,streaming")
+    parser.add_argument("--wav", nargs="*", default=None, help="WAV fixtures (default: generated tone bursts)")
+    parser.add_argument("--stt-files", type=int, default=2)
+    parser.add_argument("--stt-seconds", type=float, default=20.0)
+    parser.add_argument("--stt-fast", action="store_true",
+                        help="Feed audio as fast as possible instead of in real time")
+    # RAG
+    parser.add_argument("--rag-scales", default="10000")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--qdrant-url", default=None, help="Qdrant server; default is a local store")
+    # LLM
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake server delay before each response")
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.002, help="Fake server delay between words")
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--llm-calls", type=int, default=100)
+    parser.add_argument("--llm-transcript-lines", type=int, default=400)
+    args = parser.parse_args()
+
+    if args.compare:
+        old, new = (load_report(p) for p in args.compare)
+        rows = compare_reports(old, new, args.threshold)
+        print_comparison(rows)
+        sys.exit(1 if any(r["regression"] for r in rows) else 0)
+
+    args.stt_modes = args.stt_modes.split(",")
+    args.rag_scales = [int(s) for s in args.rag_scales.split(",")]
+    benches = {"stt": bench_stt, "rag": bench_rag, "llm": bench_llm}
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "stages": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        for stage in args.stages.split(","):
+            print(f"Running {stage} benchmark...", file=sys.stderr)
+            report["stages"][stage], seconds = timed(benches[stage], args, workdir)
+            print(f"{stage} done in {seconds:.1f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    # Process-wide: run one stage per invocation to attribute the peak
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    write_report(report, args.output)
+
+    if args.baseline:
+        rows = compare_reports(load_report(args.baseline), report, args.threshold)
+        print_comparison(rows)
+        sys.exit(1 if any(r["regression"] for r in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
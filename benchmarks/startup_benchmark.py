@@ -0,0 +1,147 @@
+"""
+Startup time benchmark.
+
+Starts fresh interpreters that do what app.py does before the page is usable and
+times each phase: importing the modules the UI needs to render, then loading the
+Whisper and embedding models. "eager" reproduces the old startup (every heavy
+module imported up front, models loaded one after the other); "lazy" is the
+current one (UI imports only, models loaded concurrently by a ServiceLoader).
+
+Cold starts use an empty model cache directory, so they include downloading and
+converting the models; warm starts reuse `--cache-dir`, primed by one unrecorded
+run.
+
+    python benchmarks/startup_benchmark.py --runs 5 --output startup_bench.json
+    python benchmarks/startup_benchmark.py --skip-models   # imports only, offline
+
+Each run is a separate process, so module import costs are measured every time;
+the OS file cache stays warm between runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_utils import REPO_ROOT, percentiles, write_report
+
+MODES = ("eager", "lazy")
+UI_MODULES = ("streamlit", "context_builder", "live_refiner", "service_loader", "transcript_store", "metrics")
+# What app.py used to import at module level
+EAGER_MODULES = UI_MODULES + ("pandas", "plotly.express", "torch", "stt_service", "stt_engine",
+                              "rag_service", "llm_service", "projection")
+
+
+def child(mode, args):
+    """Runs inside the measured process; prints one JSON line of phase timings."""
+    import importlib
+
+    timings = {}
+    started = time.perf_counter()
+    for name in EAGER_MODULES if mode == "eager" else UI_MODULES:
+        importlib.import_module(name)
+    timings["ui_seconds"] = time.perf_counter() - started
+    if args.skip_models:
+        print(json.dumps(timings))
+        return
+
+    data_dir = tempfile.mkdtemp(prefix="startup-bench-")
+
+    def load_stt():
+        from stt_engine import STTEngine
+        return STTEngine(model_size=args.whisper_model)
+
+    def load_rag():
+        from rag_service import RAGService
+        return RAGService(path=os.path.join(data_dir, "qdrant"),
+                          embedding_cache_path=os.path.join(data_dir, "embedding_cache.sqlite"),
+                          embedding_backend=args.embedding_backend)
+
+    if mode == "eager":
+        load_stt()
+        timings["stt_seconds"] = time.perf_counter() - started - timings["ui_seconds"]
+        load_rag()
+        timings["embedding_seconds"] = time.perf_counter() - started - timings["ui_seconds"] - timings["stt_seconds"]
+    else:
+        from service_loader import ServiceLoader
+
+        loader = ServiceLoader()
+        loader.submit("speech", load_stt)
+        loader.submit("embedding", load_rag)
+        loader.get("speech")
+        loader.get("embedding")
+        status = loader.status()
+        timings["stt_seconds"] = status["speech"]["seconds"]
+        timings["embedding_seconds"] = status["embedding"]["seconds"]
+    timings["ready_seconds"] = time.perf_counter() - started
+    print(json.dumps(timings))
+
+
+def run_once(mode, cache_dir, args):
+    """Spawns one measured process. Returns its timings plus the process wall time."""
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode,
+               "--whisper-model", args.whisper_model, "--embedding-backend", args.embedding_backend]
+    if args.skip_models:
+        command.append("--skip-models")
+    env = dict(os.environ, MODEL_CACHE_DIR=cache_dir)
+    started = time.perf_counter()
+    result = subprocess.run(command, cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+    # Model loaders print progress; the timings are the last line
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process_seconds"] = wall
+    return timings
+
+
+def summarize(runs):
+    """percentiles() of every phase over the runs."""
+    return {phase: percentiles([run[phase] for run in runs]) for phase in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cold and warm app startup.")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--runs", type=int, default=5, help="Warm runs per mode")
+    parser.add_argument("--cold-runs", type=int, default=1, help="Cold runs per mode (each downloads the models)")
+    parser.add_argument("--cache-dir", default=os.path.join(REPO_ROOT, "model_cache"),
+                        help="Model cache for warm runs")
+    parser.add_argument("--whisper-model", default="medium")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--skip-models", action="store_true", help="Only time the imports")
+    parser.add_argument("--output", default=None, help="Also write the JSON report here")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args)
+        return
+
+    modes = args.modes.split(",")
+    report = {
+        "python": sys.version.split()[0],
+        "whisper_model": None if args.skip_models else args.whisper_model,
+        "embedding_backend": None if args.skip_models else args.embedding_backend,
+        "runs": args.runs,
+        "cold_runs": args.cold_runs,
+        "results": {},
+    }
+    for mode in modes:
+        cold = []
+        for _ in range(args.cold_runs):
+            with tempfile.TemporaryDirectory(prefix="model-cache-") as cache_dir:
+                cold.append(run_once(mode, cache_dir, args))
+        # Prime the persistent cache so every recorded warm run hits it
+        run_once(mode, args.cache_dir, args)
+        warm = [run_once(mode, args.cache_dir, args) for _ in range(args.runs)]
+        report["results"][mode] = {
+            "cold": summarize(cold) if cold else None,
+            "warm": summarize(warm),
+        }
+        print(f"{mode}: warm p50 {report['results'][mode]['warm']['process_seconds']['p50_ms']:.0f} ms")
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import numpy as np
+from metrics import metrics
+from text_utils import estimate_tokens
+
+
+class ContextBuilder:
+    def __init__(self, rag_service, token_budget=1500, candidates=20, mmr_lambda=0.7, neighbor_radius=1):
+        """
+        Assembles the meeting context for a question within `token_budget` tokens.
+
+        `candidates` hits are fetched (with vectors) and re-ranked by maximal
+        marginal relevance, so overlapping hits don't fill the budget with the same
+        content; `mmr_lambda` trades relevance (1.0) against diversity. Each selected
+        hit brings its `neighbor_radius` adjacent segments from the same meeting.
+        Segments are packed in MMR order until the budget is spent, then printed in
+        meeting time order.
+        """
+        self.rag_service = rag_service
+        self.token_budget = token_budget
+        self.candidates = candidates
+        self.mmr_lambda = mmr_lambda
+        self.neighbor_radius = neighbor_radius
+
+    def build(self, question, **filters):
+        """
+        Returns the context text for `question`. `filters` scope retrieval like
+        RAGService.query (meeting_id, language, ...).
+        """
+        hits = self.rag_service.search(question, self.candidates, with_vectors=True, **filters)
+        if not hits:
+            return ""
+        query_vector = self.rag_service.encode_query(question)
+        ranked = [hits[i] for i in self.mmr(query_vector, np.asarray([h.vector for h in hits]))]
+
+        segments = {}
+        for record in self.rag_service.neighbors(ranked, self.neighbor_radius) if self.neighbor_radius else []:
+            segments[self._position(record)] = record
+
+        selected = {}
+        used = 0
+        for hit in ranked:
+            position = self._position(hit)
+            # The hit first, then whichever neighbors still fit
+            group = [hit] + [
+                segments[p] for p in self._adjacent(position) if p in segments
+            ]
+            for record in group:
+                # Point ids are unique; positions are not for records without a meeting
+                if record.id in selected:
+                    continue
+                cost = estimate_tokens(record.payload.get("text", "")) + 1
+                if used + cost > self.token_budget:
+                    if record is hit:
+                        break
+                    continue
+                selected[record.id] = record
+                used += cost
+            if used >= self.token_budget:
+                break
+
+        metrics.observe("rag_context_tokens", used)
+        return self._format(selected.values())
+
+    def mmr(self, query_vector, vectors):
+        """Returns candidate indices in maximal-marginal-relevance order."""
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        query_vector = query_vector / max(np.linalg.norm(query_vector), 1e-12)
+        relevance = vectors @ query_vector
+        similarity = vectors @ vectors.T
+
+        order = []
+        remaining = np.ones(len(vectors), dtype=bool)
+        redundancy = np.zeros(len(vectors))  # max similarity to anything selected
+        for _ in range(len(vectors)):
+            scores = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * redundancy
+            scores[~remaining] = -np.inf
+            best = int(scores.argmax())
+            order.append(best)
+            remaining[best] = False
+            redundancy = np.maximum(redundancy, similarity[best])
+        return order
+
+    @staticmethod
+    def _position(record):
+        return record.payload.get("meeting_id"), record.payload.get("seq")
+
+    def _adjacent(self, position):
+        meeting_id, seq = position
+        if meeting_id is None or seq is None:
+            return []
+        offsets = range(-self.neighbor_radius, self.neighbor_radius + 1)
+        # Closest neighbors first so they win when the budget is tight
+        return [(meeting_id, seq + d) for d in sorted(offsets, key=abs) if d]
+
+    @staticmethod
+    def _format(records):
+        """One block per meeting (oldest first), segments in spoken order."""
+        meetings = {}
+        for record in records:
+            meetings.setdefault(record.payload.get("meeting_id"), []).append(record)
+        for segments in meetings.values():
+            segments.sort(key=lambda r: (r.payload.get("seq") is None, r.payload.get("seq") or 0,
+                                         r.payload.get("timestamp", "")))
+
+        def started(item):
+            return min(r.payload.get("timestamp", "") for r in item[1])
+
+        blocks = []
+        for meeting_id, segments in sorted(meetings.items(), key=started):
+            lines = [r.payload.get("text", "") for r in segments]
+            if meeting_id is not None:
+                lines.insert(0, f"[Meeting {meeting_id}]")
+            blocks.append("\n".join(lines))
+        return "\n\n".join(blocks)
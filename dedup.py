@@ -0,0 +1,131 @@
+import re
+import threading
+import unicodedata
+import numpy as np
+
+# Phrases Whisper is known to produce on silence or music (subtitle credits,
+# video outros). Matched after normalization, see DuplicateFilter.is_hallucination.
+DEFAULT_HALLUCINATIONS = (
+    "thank you for watching",
+    "thanks for watching",
+    "please subscribe",
+    "like and subscribe",
+    "subscribe to my channel",
+    "see you in the next video",
+    "subtitles by the amara.org community",
+    "谢谢观看",
+    "感谢观看",
+    "谢谢大家收看",
+    "请不吝点赞 订阅 转发 打赏支持明镜与点点栏目",
+    "字幕由amara.org社区提供",
+    "ご視聴ありがとうございました",
+)
+
+_PUNCTUATION = re.compile(r"[\W_]+")
+# Repeats are only collapsed between token boundaries: whitespace, CJK punctuation,
+# or ASCII punctuation followed by whitespace, so "1,000,000" or "www.w.w" are left alone
+_BREAK = r"[\s，、。！？；：…]"
+_SEPARATOR = rf"(?:{_BREAK}|[,.!?;:](?=\s|$))"
+_WORD = r"[^\W\d_]+(?:['’-][^\W\d_]+)*"
+# Phrases are bounded (8 words, 16 CJK characters) to keep the search linear
+_WORDS = rf"{_WORD}(?:\s+{_WORD}){{0,7}}?"
+_CJK = r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]{2,16}?"
+# A word phrase repeated at least three times with separators in between ("ok, ok, ok"),
+# or a CJK phrase of 2+ characters repeated at least three times ("好的好的好的")
+_REPEAT = re.compile(
+    rf"(?:^|(?<={_BREAK}))"
+    rf"(?:(?P<words>{_WORDS})(?:{_SEPARATOR}+(?P=words)){{2,}}|(?P<cjk>{_CJK})(?:{_SEPARATOR}*(?P=cjk)){{2,}})"
+    rf"(?=$|{_BREAK}|[,.!?;:](?:\s|$))"
+)
+
+
+def _fold(text):
+    """Lowercase NFKC text with punctuation and whitespace removed."""
+    return _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).lower())
+
+
+def collapse_repeats(text):
+    """
+    Collapses a phrase Whisper looped on ("好的好的好的好的", "ok, ok, ok, ok")
+    to a single occurrence. Only whole tokens are collapsed; numbers, dates and
+    repeats inside a word ("lalala") are left alone.
+    """
+    return _REPEAT.sub(lambda m: m.group("words") or m.group("cjk"), text)
+
+
+class DuplicateFilter:
+    def __init__(self, threshold=0.95, window=1024, blocklist=DEFAULT_HALLUCINATIONS):
+        """
+        Ingest-time near-duplicate and hallucination filter.
+
+        New embeddings are compared against the last `window` stored vectors and the
+        earlier items of their own batch with a single matrix product; an item whose
+        cosine similarity to an earlier one in the same scope (meeting) reaches
+        `threshold` is a duplicate of it. Texts made up only of `blocklist` phrases
+        are hallucinations.
+        """
+        self.threshold = threshold
+        self.window = window
+        self.blocklist = sorted({_fold(p) for p in blocklist if _fold(p)}, key=len, reverse=True)
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._ids = [None] * window
+        self._scopes = [None] * window
+        self._size = 0
+        self._next = 0
+
+    def is_hallucination(self, text):
+        """True if nothing but blocklisted phrases and punctuation remain."""
+        folded = _fold(text)
+        for phrase in self.blocklist:
+            folded = folded.replace(phrase, "")
+            if not folded:
+                return True
+        return not folded
+
+    def filter(self, ids, vectors, scopes):
+        """
+        Returns a list with, per item, None if it should be stored or the id of the
+        earlier item it duplicates. Stored items are added to the window.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        if not n:
+            return []
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.window, vectors.shape[1]), dtype=np.float32)
+            size = self._size
+            candidates = np.vstack([self._vectors[:size], vectors])
+            candidate_ids = self._ids[:size] + list(ids)
+            candidate_scopes = np.array(self._scopes[:size] + list(scopes), dtype=object)
+            similarity = vectors @ candidates.T
+
+            # Only same-scope, earlier items count; re-adding an id overwrites itself
+            same_scope = candidate_scopes[None, :] == np.array(scopes, dtype=object)[:, None]
+            earlier = np.arange(size + n)[None, :] < (size + np.arange(n))[:, None]
+            same_id = np.array(candidate_ids, dtype=object)[None, :] == np.array(ids, dtype=object)[:, None]
+            similarity[~(same_scope & earlier) | same_id] = -1.0
+
+            results = []
+            kept = np.ones(size + n, dtype=bool)
+            for i in range(n):
+                row = np.where(kept, similarity[i], -1.0)
+                best = int(row.argmax())
+                if row[best] >= self.threshold:
+                    kept[size + i] = False
+                    results.append(candidate_ids[best])
+                else:
+                    results.append(None)
+                    self._remember(ids[i], vectors[i], scopes[i])
+        return results
+
+    def _remember(self, point_id, vector, scope):
+        self._vectors[self._next] = vector
+        self._ids[self._next] = point_id
+        self._scopes[self._next] = scope
+        self._next = (self._next + 1) % self.window
+        self._size = min(self._size + 1, self.window)
@@ -0,0 +1,70 @@
+import os
+import zlib
+import numpy as np
+
+# "torch": full-precision PyTorch; "onnx": ONNX Runtime; "onnx-int8": dynamically
+# int8-quantized ONNX Runtime model (faster on CPU, small recall cost); "hash":
+# model-free stand-in for offline benchmarks (see HashingEncoder)
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8", "hash")
+# Downloaded and converted model files; keep it on a persistent volume so
+# restarts load from disk instead of the network
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "./model_cache")
+
+
+class HashingEncoder:
+    def __init__(self, dim=384):
+        """
+        Deterministic stand-in for a SentenceTransformer: signed feature hashing of
+        words and character bigrams into `dim` dimensions, L2-normalized. Needs no
+        model download, so benchmarks and load tests run offline; similar texts get
+        similar vectors, but there is no semantic understanding.
+        """
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self):
+        return self.dim
+
+    def encode(self, texts, batch_size=64, **kwargs):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            text = text.lower()
+            for feature in text.split() + [text[j:j + 2] for j in range(len(text) - 1)]:
+                h = zlib.crc32(feature.encode("utf-8"))
+                vectors[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+
+def load_encoder(model_name, backend="torch", cache_dir=MODEL_CACHE_DIR, quantization="avx2"):
+    """
+    Loads a SentenceTransformer with the requested inference backend. The int8
+    model is exported once (requires `optimum` and `onnxruntime`) and cached under
+    `cache_dir`; later loads use the cached file. `quantization` selects the
+    instruction set the int8 kernels target ("avx2", "avx512", "avx512_vnni" or
+    "arm64"). Downloaded weights are cached under `cache_dir` as well.
+
+    sentence_transformers (and torch) are imported here rather than at module
+    level, so importing this module stays cheap.
+    """
+    if backend == "hash":
+        return HashingEncoder()
+
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, cache_folder=cache_dir)
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", cache_folder=cache_dir)
+    if backend != "onnx-int8":
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {EMBEDDING_BACKENDS})")
+
+    local_dir = os.path.join(cache_dir, model_name.replace("/", "__") + "-onnx")
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    if not os.path.exists(os.path.join(local_dir, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        print(f"Exporting int8 ONNX model for {model_name} to {local_dir}...")
+        model = SentenceTransformer(model_name, backend="onnx", cache_folder=cache_dir)
+        model.save(local_dir)
+        export_dynamic_quantized_onnx_model(model, quantization, local_dir)
+    return SentenceTransformer(local_dir, backend="onnx", model_kwargs={"file_name": file_name})
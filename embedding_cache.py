@@ -0,0 +1,131 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from metrics import metrics
+from text_utils import normalize_text
+
+
+class EmbeddingCache:
+    def __init__(self, model_name, path="./embedding_cache.sqlite", memory_items=20000,
+                 max_disk_bytes=512 * 1024 * 1024):
+        """
+        Content-addressed embedding cache keyed by model name + hash of the normalized
+        text. An in-memory LRU of `memory_items` vectors sits in front of a SQLite
+        table of float32 blobs; when the table grows past `max_disk_bytes` the least
+        recently used rows are evicted. `path=None` keeps the memory tier only.
+        """
+        self.model_name = model_name
+        self.memory_items = memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+            self._db.commit()
+            self._disk_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def key(self, text):
+        digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def encode(self, encoder, texts, batch_size=64):
+        """
+        Returns a float32 array of shape (len(texts), dim). Only texts missing from
+        both tiers are passed to `encoder.encode`, once per distinct key.
+        """
+        keys = [self.key(t) for t in texts]
+        found = {}
+        with self._lock:
+            for k in keys:
+                if k in self._memory:
+                    self._memory.move_to_end(k)
+                    found[k] = self._memory[k]
+        metrics.inc("embedding_cache_hits_total", len(found), tier="memory")
+
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing and self._db is not None:
+            disk_hits = self._load(missing)
+            metrics.inc("embedding_cache_hits_total", len(disk_hits), tier="disk")
+            found.update(disk_hits)
+            self._remember(disk_hits)
+            missing = [k for k in missing if k not in disk_hits]
+
+        if missing:
+            metrics.inc("embedding_cache_misses_total", len(missing))
+            first_text = {}
+            for k, t in zip(keys, texts):
+                first_text.setdefault(k, t)
+            vectors = np.asarray(
+                encoder.encode([first_text[k] for k in missing], batch_size=batch_size),
+                dtype=np.float32,
+            )
+            computed = dict(zip(missing, vectors))
+            found.update(computed)
+            self._remember(computed)
+            if self._db is not None:
+                self._store(computed)
+
+        return np.stack([found[k] for k in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+
+    def _remember(self, items):
+        with self._lock:
+            for k, v in items.items():
+                self._memory[k] = v
+                self._memory.move_to_end(k)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _load(self, keys):
+        hits = {}
+        now = time.time()
+        with self._lock:
+            # SQLite limits the number of bound parameters per statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall()
+                for k, blob in rows:
+                    hits[k] = np.frombuffer(blob, dtype=np.float32)
+            if hits:
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                     [(now, k) for k in hits])
+                self._db.commit()
+        return hits
+
+    def _store(self, items):
+        now = time.time()
+        rows = [(k, v.astype(np.float32).tobytes(), now) for k, v in items.items()]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._disk_bytes += sum(len(r[1]) for r in rows)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Drop the least recently used rows until the table is 10% under the limit
+        target = int(self.max_disk_bytes * 0.9)
+        while self._disk_bytes > target:
+            rows = self._db.execute(
+                "SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used LIMIT 1000").fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", [(k,) for k, _ in rows])
+            self._disk_bytes -= sum(size for _, size in rows)
+        metrics.inc("embedding_cache_evictions_total")
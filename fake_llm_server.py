@@ -0,0 +1,147 @@
+"""
+Deterministic stand-in for an OpenAI-compatible chat-completions server, for
+offline load tests and benchmarks of the LLM pipeline.
+
+    python fake_llm_server.py --port 8808 --latency 0.5
+    LLM_BACKEND=openai LLM_BASE_URL=http://localhost:8808/v1 streamlit run app.py
+
+Responses depend only on the prompt: refine prompts get their transcript lines
+back as JSON (trimmed), minutes prompts a fixed Markdown skeleton listing the
+transcript, and anything else an answer quoting the prompt's hash.
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_REFINE_LINE = re.compile(r"^\s*ID (\S+): (.*)$", re.MULTILINE)
+
+
+def fake_completion(prompt):
+    """The deterministic reply for `prompt`."""
+    if "Raw Transcript (ID: Text):" in prompt:
+        section = prompt.split("Raw Transcript (ID: Text):", 1)[1].split("Following context", 1)[0]
+        items = []
+        for segment_id, text in _REFINE_LINE.findall(section):
+            items.append({"id": int(segment_id) if segment_id.isdigit() else segment_id, "text": text.strip()})
+        return json.dumps(items, ensure_ascii=False)
+    if "Transcript Excerpt:" in prompt:
+        lines = re.findall(r"^\s*- (.*)$", prompt.split("Transcript Excerpt:", 1)[1], re.MULTILINE)
+        return "Discussion:\n" + "\n".join(f"- {line}" for line in lines[:3])
+    if "minute-taker" in prompt:
+        lines = re.findall(r"^\s*- (.*)$", prompt, re.MULTILINE)
+        points = "\n".join(f"- {line}" for line in lines[:20])
+        return (
+            "# Meeting Minutes\n## Date: [Current Date]\n## Executive Summary\n"
+            f"Discussion of {len(lines)} transcript lines.\n## Key Discussion Points\n{points}\n"
+            "## Action Items\n- None recorded\n## Decisions Made\n- None recorded\n"
+        )
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12]
+    return f"Fake answer {digest}: based on the meeting context, the team discussed this topic."
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like a real server
+    latency = 0.0
+    chunk_delay = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model, content):
+        """Sends `content` word by word as server-sent events, `chunk_delay` apart."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece in re.findall(r"\S+\s*|\s+", content):
+                chunk = {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                time.sleep(self.chunk_delay)
+            self._write_chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client cancelled the stream
+            self.close_connection = True
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "\n".join(m.get("content", "") for m in request.get("messages", []))
+        time.sleep(self.latency)
+        content = fake_completion(prompt)
+        if request.get("stream"):
+            self._send_stream(request.get("model", "fake"), content)
+            return
+        self._send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4},
+        })
+
+
+def make_server(host="127.0.0.1", port=8808, latency=0.0, chunk_delay=0.0):
+    """
+    Returns an unstarted server; port 0 picks a free port. `latency` is the delay
+    before the first token, `chunk_delay` the delay between streamed words.
+    """
+    handler = type("Handler", (FakeLLMHandler,), {"latency": latency, "chunk_delay": chunk_delay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve_in_thread(port=0, latency=0.0, chunk_delay=0.0):
+    """Starts a server on a background thread. Returns (server, base_url)."""
+    server = make_server(port=port, latency=latency, chunk_delay=chunk_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic OpenAI-compatible fake LLM server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed words")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.latency, args.chunk_delay)
+    print(f"Fake LLM server on http://{args.host}:{server.server_address[1]}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from metrics import metrics
+
+
+class IngestQueue:
+    def __init__(self, write_batch, spool_path=None, maxsize=10000, max_batch=256, max_latency=0.5,
+                 max_attempts=5, retry_delay=0.5, dead_letter_path=None):
+        """
+        Bounded write-behind queue with a single background writer.
+
+        Items are coalesced into micro-batches of up to `max_batch` items, or whatever
+        arrived within `max_latency` seconds of the first one, and handed to
+        `write_batch(texts, payloads, ids)`. With `spool_path`, every item is appended
+        to a JSON-lines spool before `put` returns and the number of committed items
+        is recorded after each batch, so pending writes are replayed after a restart.
+        Point ids are assigned at enqueue time, which makes a replay idempotent.
+
+        A failing batch is retried up to `max_attempts` times with exponential
+        backoff starting at `retry_delay` seconds. If it still fails, it is split in
+        halves to store what can be stored; items that fail on their own are
+        appended to `dead_letter_path` (default: next to the spool) and skipped, so
+        one bad item cannot stall the queue.
+        """
+        self.write_batch = write_batch
+        self.spool_path = spool_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        if dead_letter_path is None and spool_path:
+            dead_letter_path = spool_path + ".dead.jsonl"
+        self.dead_letter_path = dead_letter_path
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        # Serializes producers so the spool and the queue see items in the same order
+        self._put_lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._enqueued = 0   # items ever written to the current spool
+        self._committed = 0  # items of the current spool that are stored
+        self._closed = False
+
+        replay = self._load_spool() if spool_path else []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        if replay:
+            print(f"Replaying {len(replay)} spooled transcripts...")
+            with self._lock:
+                self._pending += len(replay)
+            for item in replay:
+                self._queue.put(item)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def put(self, texts, payloads=None, ids=None):
+        """
+        Enqueues transcripts and returns their point ids. Blocks while the queue is
+        full, which pushes back on producers instead of growing without bound.
+        """
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        items = [
+            {"id": ids[i], "text": text, "payload": payloads[i] if payloads else {}}
+            for i, text in enumerate(texts)
+            if text and text.strip()
+        ]
+        if not items:
+            return []
+        with self._put_lock:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("IngestQueue is closed")
+                if self.spool_path:
+                    with open(self.spool_path, "a", encoding="utf-8") as f:
+                        for item in items:
+                            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                    self._enqueued += len(items)
+                self._pending += len(items)
+            for item in items:
+                self._queue.put(item)
+        metrics.set_gauge("rag_ingest_queue_depth", self._queue.qsize())
+        return [item["id"] for item in items]
+
+    def flush(self, timeout=None):
+        """Waits until everything enqueued so far is stored. Returns False on timeout."""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+
+    def close(self, timeout=None):
+        """Stops accepting items, drains the queue and stops the writer."""
+        with self._lock:
+            self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            if stop:
+                return
+
+    def _write_items(self, batch):
+        with metrics.time("rag_ingest_batch_seconds"):
+            self.write_batch(
+                [item["text"] for item in batch],
+                [item["payload"] for item in batch],
+                [item["id"] for item in batch],
+            )
+
+    def _write(self, batch):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                self._write_items(batch)
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    print(f"Error storing batch of {len(batch)} transcripts, giving up after {attempt} attempts: {e}")
+                    self._isolate(batch, e)
+                    break
+                # Keep the batch (it is still in the spool) and retry; a full queue
+                # blocks producers meanwhile rather than losing transcripts
+                print(f"Error storing batch of {len(batch)} transcripts, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+        metrics.observe("rag_ingest_batch_size", len(batch))
+        with self._idle:
+            self._pending -= len(batch)
+            if self.spool_path:
+                self._committed += len(batch)
+                self._write_committed()
+            if self._pending == 0:
+                self._idle.notify_all()
+                # Nothing in flight: start a fresh spool
+                if self.spool_path and self._committed == self._enqueued:
+                    open(self.spool_path, "w").close()
+                    self._enqueued = self._committed = 0
+                    self._write_committed()
+        metrics.set_gauge("rag_ingest_queue_depth", self._queue.qsize())
+
+    def _isolate(self, batch, error):
+        """Stores a failing batch by halves; items that fail on their own are dead-lettered."""
+        if len(batch) == 1:
+            self._dead_letter(batch[0], error)
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                self._write_items(half)
+            except Exception as e:
+                self._isolate(half, e)
+
+    def _dead_letter(self, item, error):
+        print(f"Dropping transcript {item['id']} after repeated errors: {error}")
+        metrics.inc("rag_ingest_dead_letter_total")
+        if self.dead_letter_path:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                record = {"item": item, "error": str(error), "time": time.time()}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _write_committed(self):
+        tmp = self.spool_path + ".committed.tmp"
+        with open(tmp, "w") as f:
+            f.write(str(self._committed))
+        os.replace(tmp, self.spool_path + ".committed")
+
+    def _load_spool(self):
+        """Returns spooled items that were not committed before the last shutdown."""
+        if not os.path.exists(self.spool_path):
+            return []
+        committed = 0
+        if os.path.exists(self.spool_path + ".committed"):
+            with open(self.spool_path + ".committed") as f:
+                committed = int(f.read().strip() or 0)
+        items = []
+        with open(self.spool_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    items.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Torn last line from a crash; that put() never returned
+                    continue
+        self._enqueued = len(items)
+        self._committed = min(committed, len(items))
+        return items[self._committed:]
@@ -0,0 +1,220 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+# Han, Hiragana/Katakana and Hangul runs have no reliable word boundaries
+_CJK = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_WORD = rf"[^\W_{_CJK}]+"
+_TOKEN = re.compile(rf"[{_CJK}]+|{_WORD}(?:[-_./]{_WORD})*")
+_CJK_RUN = re.compile(rf"^[{_CJK}]+$")
+
+
+def tokenize(text):
+    """
+    CJK-aware tokenizer. Latin/digit words are lowercased; codes such as "PRJ-1024"
+    or "v2.5" are kept whole and also split into parts. CJK runs become character
+    unigrams plus bigrams, which matches names and terms without a segmenter.
+    """
+    tokens = []
+    for match in _TOKEN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if _CJK_RUN.match(token):
+            tokens.extend(token)
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            parts = re.split(r"[-_./]", token)
+            if len(parts) > 1:
+                tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class BM25Index:
+    def __init__(self, path=None, k1=1.2, b=0.75, fields=()):
+        """
+        Incremental in-memory BM25 inverted index.
+
+        Every add is appended to a JSON-lines log at `path` (term frequencies per
+        document), which is replayed on startup; re-adding a document id replaces it.
+        `compact()` rewrites the log without superseded entries.
+
+        The values of `fields` (e.g. meeting_id) are indexed per document as well,
+        so `search(..., where=...)` scores only the matching documents.
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.fields = tuple(fields)
+        self._lock = threading.Lock()
+        self._postings = {}   # term -> {doc_id: tf}
+        self._doc_terms = {}  # doc_id -> (terms...)
+        self._doc_len = {}
+        self._total_len = 0
+        self._field_docs = {}  # (field, value) -> {doc_id, ...}
+        self._doc_fields = {}  # doc_id -> {field: value}, None if never given
+        self._missing_fields = 0
+        self._log_entries = 0
+        if path and os.path.exists(path):
+            self._replay()
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    @property
+    def missing_fields(self):
+        """Number of documents indexed without their field values (e.g. from an older log)."""
+        return self._missing_fields if self.fields else 0
+
+    def _replay(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn last line from a crash
+                    continue
+                self._index(entry["id"], entry["tf"], entry.get("fields"))
+                self._log_entries += 1
+        print(f"Loaded lexical index: {len(self)} documents.")
+
+    def add_many(self, items):
+        """
+        Indexes [(doc_id, text), ...] or [(doc_id, text, {field: value}), ...] and
+        persists them.
+        """
+        entries = [
+            (item[0], dict(Counter(tokenize(item[1]))), self._field_values(item[2] if len(item) > 2 else {}))
+            for item in items
+        ]
+        with self._lock:
+            for doc_id, tf, fields in entries:
+                self._index(doc_id, tf, fields)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for doc_id, tf, fields in entries:
+                        f.write(self._log_line(doc_id, tf, fields))
+                self._log_entries += len(entries)
+        # Re-saved documents leave superseded entries behind
+        if self.path and self._log_entries > 2 * len(self) + 1000:
+            self.compact()
+
+    def _field_values(self, values):
+        return {field: values[field] for field in self.fields if values.get(field) is not None}
+
+    def _log_line(self, doc_id, tf, fields):
+        entry = {"id": doc_id, "tf": tf}
+        if self.fields and fields is not None:
+            entry["fields"] = fields
+        return json.dumps(entry, ensure_ascii=False) + "\n"
+
+    def _index(self, doc_id, tf, fields=None):
+        self._remove(doc_id)
+        if fields is None:
+            self._missing_fields += 1
+        else:
+            for field, value in fields.items():
+                self._field_docs.setdefault((field, value), set()).add(doc_id)
+        self._doc_fields[doc_id] = fields
+        for term, count in tf.items():
+            self._postings.setdefault(term, {})[doc_id] = count
+        length = sum(tf.values())
+        self._doc_terms[doc_id] = tuple(tf)
+        self._doc_len[doc_id] = length
+        self._total_len += length
+
+    def _remove(self, doc_id):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+        fields = self._doc_fields.pop(doc_id)
+        if fields is None:
+            self._missing_fields -= 1
+            return
+        for key in fields.items():
+            docs = self._field_docs.get(key)
+            if docs is not None:
+                docs.discard(doc_id)
+                if not docs:
+                    del self._field_docs[key]
+
+    def search(self, query, limit=10, doc_ids=None, where=None):
+        """
+        Returns [(doc_id, score), ...] best first. `doc_ids` and `where` ({field:
+        value} of indexed fields, e.g. one meeting) restrict scoring to a subset
+        before the top `limit` are taken; small subsets are scored document by
+        document, so the cost follows the subset rather than the posting list lengths.
+        """
+        terms = set(tokenize(query))
+        for field in where or ():
+            if field not in self.fields:
+                raise ValueError(f"Field {field!r} is not indexed")
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs or not terms:
+                return []
+            for field, value in (where or {}).items():
+                docs = self._field_docs.get((field, value), set())
+                doc_ids = docs if doc_ids is None else docs.intersection(doc_ids)
+            if doc_ids is not None and not doc_ids:
+                return []
+            avg_len = self._total_len / n_docs
+            postings_by_term = {t: self._postings[t] for t in terms if t in self._postings}
+            idf = {
+                t: math.log(1 + (n_docs - len(p) + 0.5) / (len(p) + 0.5))
+                for t, p in postings_by_term.items()
+            }
+            scores = {}
+
+            def add(doc_id, term, tf):
+                norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf[term] * tf * (self.k1 + 1) / (tf + norm)
+
+            if doc_ids is not None and len(doc_ids) < sum(len(p) for p in postings_by_term.values()):
+                for doc_id in doc_ids:
+                    for term, postings in postings_by_term.items():
+                        tf = postings.get(doc_id)
+                        if tf:
+                            add(doc_id, term, tf)
+            else:
+                for term, postings in postings_by_term.items():
+                    for doc_id, tf in postings.items():
+                        if doc_ids is None or doc_id in doc_ids:
+                            add(doc_id, term, tf)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def compact(self):
+        """Rewrites the log with one entry per live document."""
+        if not self.path:
+            return
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for doc_id, terms in self._doc_terms.items():
+                    tf = {term: self._postings[term][doc_id] for term in terms}
+                    f.write(self._log_line(doc_id, tf, self._doc_fields[doc_id]))
+            os.replace(tmp, self.path)
+            self._log_entries = len(self._doc_terms)
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked id lists: score(id) = sum over lists of 1 / (k + rank).
+    Returns ids ordered by fused score.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,132 @@
+import threading
+import time
+from metrics import metrics
+
+
+class BackgroundRefiner:
+    def __init__(self, llm_service, agenda="", stt_service=None, batch_size=8, stable_seconds=4.0,
+                 context_segments=5, min_interval=3.0, max_lag_seconds=3.0, retries=2):
+        """
+        Refines transcript segments in the background while recording continues.
+
+        Segments passed to `add` are grouped into batches of `batch_size`, or
+        whatever has waited `stable_seconds`, and refined as one window (with up to
+        `retries` retries) together with the agenda and the last `context_segments`
+        refined lines. Calls are at least `min_interval` seconds apart and are
+        deferred while `stt_service` reports more than `max_lag_seconds` of
+        transcription lag, so the live path keeps priority.
+        Refined text is kept per segment ID in `refined`; segments of a batch that
+        failed are left out of it and retried once more by `finish`.
+        """
+        self.llm_service = llm_service
+        self.agenda = agenda
+        self.stt_service = stt_service
+        self.batch_size = batch_size
+        self.stable_seconds = stable_seconds
+        self.context_segments = context_segments
+        self.min_interval = min_interval
+        self.max_lag_seconds = max_lag_seconds
+        self.retries = retries
+
+        self.refined = {}
+        self._pending = []  # (id, text, arrival time)
+        self._failed = []  # segments whose batch failed, retried by finish()
+        self._context = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._in_flight = 0
+        self._draining = False
+        self._retried_failed = False
+        self._cancelled = False
+        self._last_call = 0.0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self):
+        return len(self._pending) + len(self._failed) + self._in_flight
+
+    def add(self, segment_id, text):
+        """Queues a committed segment for refinement."""
+        with self._wakeup:
+            if self._cancelled:
+                return
+            self._pending.append((segment_id, text, time.monotonic()))
+            self._wakeup.notify()
+
+    def cancel(self):
+        """Stops the worker and drops pending segments; an in-flight result is discarded."""
+        with self._wakeup:
+            self._cancelled = True
+            self._pending = []
+            self._failed = []
+            self._wakeup.notify()
+
+    def finish(self, timeout=None):
+        """
+        Refines everything still pending, including segments whose batch failed,
+        without waiting for stability or STT lag, stops the worker and returns the
+        refined texts by ID. Segments that fail again are not in the result.
+        """
+        with self._wakeup:
+            self._draining = True
+            self._wakeup.notify()
+        self._thread.join(timeout)
+        with self._lock:
+            return dict(self.refined)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while True:
+                    if self._cancelled:
+                        return
+                    if self._draining and not self._pending and self._in_flight == 0:
+                        if self._retried_failed or not self._failed:
+                            return
+                        # Final pass: one more attempt for segments whose batch failed
+                        self._pending, self._failed = self._failed, []
+                        self._retried_failed = True
+                    wait = self._next_batch_in()
+                    if wait <= 0:
+                        break
+                    self._wakeup.wait(wait)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                self._in_flight = len(batch)
+                context = list(self._context)
+                self._last_call = time.monotonic()
+
+            transcripts = [{"id": segment_id, "text": text} for segment_id, text, _ in batch]
+            with metrics.time("llm_live_refine_seconds"):
+                results = self.llm_service.refine_batch(self.agenda, transcripts, context, retries=self.retries)
+
+            with self._wakeup:
+                self._in_flight = 0
+                if self._cancelled:
+                    return
+                self.refined.update(results)
+                failed = [item for item in batch if item[0] not in results]
+                self._failed.extend(failed)
+                refined_lines = [results[t["id"]] for t in transcripts if t["id"] in results]
+                self._context = (self._context + refined_lines)[-self.context_segments:]
+            metrics.inc("llm_live_refined_segments_total", len(results))
+            if failed:
+                metrics.inc("llm_live_refine_failed_segments_total", len(failed))
+
+    def _next_batch_in(self):
+        """Seconds until the next batch may be sent (<= 0: now). Called with the lock held."""
+        if not self._pending:
+            return 1.0
+        now = time.monotonic()
+        rate_wait = self._last_call + self.min_interval - now
+        if self._draining:
+            return rate_wait
+        if len(self._pending) < self.batch_size:
+            stable_wait = self._pending[0][2] + self.stable_seconds - now
+            if stable_wait > 0:
+                return min(stable_wait, 1.0)
+        if self.stt_service is not None and self.stt_service.lag_seconds > self.max_lag_seconds:
+            metrics.inc("llm_live_refine_deferred_total")
+            return 1.0
+        return min(rate_wait, 1.0)
@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+from typing import Iterator, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class LLMBackend:
+    """
+    Text-in/text-out model endpoint. At most `max_concurrency` requests run at
+    once per backend; further callers wait for a slot. `timeout` bounds each call.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, max_concurrency: int = 4, timeout: float = 120.0):
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    def generate(self, prompt: str) -> str:
+        with self._slots:
+            return self._generate(prompt)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        """
+        Yields the response in chunks as the server produces them. The slot is held
+        until the stream is exhausted or closed.
+        """
+        with self._slots:
+            yield from self._stream(prompt)
+
+    def _generate(self, prompt: str) -> str:
+        raise NotImplementedError
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        # Backends without native streaming return the whole text as one chunk
+        yield self._generate(prompt)
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str = "gemini-2.5-flash", max_concurrency: int = 4,
+                 timeout: float = 120.0):
+        super().__init__(model, max_concurrency, timeout)
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model)
+
+    def _generate(self, prompt: str) -> str:
+        return self._model.generate_content(prompt, request_options={"timeout": self.timeout}).text
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        response = self._model.generate_content(prompt, stream=True, request_options={"timeout": self.timeout})
+        for chunk in response:
+            # .text raises on chunks without text parts (safety blocks, finish-only chunks)
+            try:
+                text = chunk.text
+            except ValueError:
+                continue
+            if text:
+                yield text
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    name = "openai"
+
+    def __init__(self, base_url: str = "http://localhost:11434/v1", model: str = "llama3.1",
+                 api_key: Optional[str] = None, max_concurrency: int = 2, timeout: float = 120.0,
+                 temperature: float = 0.2):
+        """
+        Chat-completions client for Ollama (`http://localhost:11434/v1`), llama.cpp,
+        vLLM or OpenAI. One pooled keep-alive session is shared by all threads, sized
+        to `max_concurrency` connections; connection errors are retried.
+        """
+        super().__init__(model, max_concurrency, timeout)
+        self.base_url = base_url.rstrip("/")
+        self.temperature = temperature
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=max_concurrency,
+            max_retries=Retry(connect=2, backoff_factor=0.5),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def _request(self, prompt: str, stream: bool = False) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+            "stream": stream,
+        }
+
+    def _generate(self, prompt: str) -> str:
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            json=self._request(prompt),
+            timeout=(5.0, self.timeout),
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        # Server-sent events: "data: {chunk}" lines, terminated by "data: [DONE]"
+        response = self.session.post(
+            f"{self.base_url}/chat/completions",
+            json=self._request(prompt, stream=True),
+            timeout=(5.0, self.timeout),
+            stream=True,
+        )
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    return
+                choices = json.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+        finally:
+            # Closing mid-stream drops the connection so the server stops generating
+            response.close()
+
+
+def backend_from_env(api_key: Optional[str] = None) -> Optional[LLMBackend]:
+    """
+    Builds the backend selected by LLM_BACKEND ("gemini", the default, or
+    "openai" for any OpenAI-compatible server such as Ollama). LLM_MODEL,
+    LLM_BASE_URL, LLM_API_KEY, LLM_MAX_CONCURRENCY and LLM_TIMEOUT override the
+    defaults. Returns None when Gemini is selected but no API key is set.
+    """
+    kind = os.getenv("LLM_BACKEND", "gemini").lower()
+    model = os.getenv("LLM_MODEL")
+    timeout = float(os.getenv("LLM_TIMEOUT", "120"))
+    max_concurrency = os.getenv("LLM_MAX_CONCURRENCY")
+
+    if kind in ("openai", "ollama"):
+        return OpenAICompatibleBackend(
+            base_url=os.getenv("LLM_BASE_URL", "http://localhost:11434/v1"),
+            model=model or "llama3.1",
+            api_key=os.getenv("LLM_API_KEY"),
+            max_concurrency=int(max_concurrency or 2),
+            timeout=timeout,
+        )
+    if kind != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND: {kind}")
+
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        return None
+    return GeminiBackend(
+        api_key,
+        model=model or "gemini-2.5-flash",
+        max_concurrency=int(max_concurrency or 4),
+        timeout=timeout,
+    )
@@ -1,99 +1,275 @@
 import os
+import hashlib
 import json
-import google.generativeai as genai
-from typing import List, Dict, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
 from dotenv import load_dotenv
+from llm_backends import LLMBackend, backend_from_env
+from llm_cache import LLMCache
+from metrics import metrics
+from text_utils import estimate_tokens
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Part of every cache key: bump a template's version whenever its prompt changes
+PROMPT_VERSIONS = {
+    "refine": 2,
+    "minutes": 1,
+    "minutes_section": 1,
+    "minutes_reduce": 1,
+    "answer": 1,
+}
+
 class LLMService:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, backend: Optional[LLMBackend] = None,
+                 cache: Optional[LLMCache] = None):
         """
-        Initialize the LLM Service with Google Gemini.
+        Initialize the LLM Service. Without an explicit `backend`, the one selected
+        by LLM_BACKEND is used (Google Gemini by default, see llm_backends).
+
+        Responses are cached on disk (`cache`, by default an LLMCache at
+        LLM_CACHE_PATH with LLM_CACHE_TTL seconds). LLM_CACHE=off or
+        `use_cache = False` bypasses the cache.
         """
-        if not api_key:
-            api_key = os.getenv("GOOGLE_API_KEY")
-        
-        if not api_key:
+        self.backend = backend or backend_from_env(api_key)
+        self.use_cache = os.getenv("LLM_CACHE", "on").lower() not in ("0", "off", "false", "no")
+        self.cache = cache
+        if self.cache is None and self.use_cache:
+            self.cache = LLMCache(
+                path=os.getenv("LLM_CACHE_PATH", "./llm_cache.sqlite"),
+                ttl_seconds=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+            )
+        if not self.backend:
             # We don't raise error here to allow app to start, 
             # but methods will fail if called without key.
             print("Warning: GOOGLE_API_KEY not found in environment variables or .env file.")
-            self.model = None
         else:
-            genai.configure(api_key=api_key)
-            # Using gemini-2.5-flash for speed and large context window
-            self.model = genai.GenerativeModel('gemini-2.5-flash')
+            print(f"LLM backend: {self.backend.name} ({self.backend.model})")
+
+    def _cache_key(self, method: str, prompt: str) -> Optional[str]:
+        if not (self.use_cache and self.cache):
+            return None
+        return LLMCache.key(self.backend.name, self.backend.model, method, PROMPT_VERSIONS[method], prompt)
 
-    def refine_transcript(self, agenda: str, raw_transcripts: List[Dict]) -> List[Dict]:
+    def _generate(self, method: str, prompt: str, validate: Optional[Callable[[str], bool]] = None) -> str:
         """
-        Refines the raw transcripts based on the agenda using Gemini.
+        Single entry point for LLM calls, timed per method. Returns the response text.
+        Cached responses are returned without a call; a new response is cached only
+        if `validate` (when given) accepts it.
+        """
+        key = self._cache_key(method, prompt)
+        if key:
+            cached = self.cache.get(key, template=method)
+            if cached is not None:
+                return cached
+        try:
+            with metrics.time("llm_call_seconds", method=method, backend=self.backend.name):
+                text = self.backend.generate(prompt)
+        except Exception:
+            metrics.inc("llm_errors_total", method=method, backend=self.backend.name)
+            raise
+        if key and (validate is None or validate(text)):
+            self.cache.put(key, text)
+        return text
+
+    def _stream(self, method: str, prompt: str, cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Streaming counterpart of _generate. Records time to first token and total
+        time; closing the stream (or setting `cancel_event`) ends the request.
+        A cached response is yielded as one chunk; only complete streams are cached.
+        """
+        key = self._cache_key(method, prompt)
+        if key:
+            cached = self.cache.get(key, template=method)
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        start = time.perf_counter()
+        first = True
+        stream = self.backend.stream(prompt)
+        try:
+            for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    metrics.inc("llm_streams_cancelled_total", method=method, backend=self.backend.name)
+                    return
+                if first:
+                    metrics.observe("llm_ttft_seconds", time.perf_counter() - start,
+                                    method=method, backend=self.backend.name)
+                    first = False
+                chunks.append(chunk)
+                yield chunk
+            metrics.observe("llm_call_seconds", time.perf_counter() - start, method=method, backend=self.backend.name)
+            if key:
+                self.cache.put(key, "".join(chunks))
+        except Exception:
+            metrics.inc("llm_errors_total", method=method, backend=self.backend.name)
+            raise
+        finally:
+            stream.close()
+
+    def refine_transcript(self, agenda: str, raw_transcripts: List[Dict], window_tokens: int = 1500,
+                          overlap: int = 2, max_workers: int = 4, retries: int = 2,
+                          preceding: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Refines the raw transcripts based on the agenda using the LLM.
         Returns a list of dicts with the same IDs but corrected text.
+
+        The transcript is split into windows of about `window_tokens` tokens, each
+        with `overlap` segments of context on either side, and the windows are
+        refined concurrently on up to `max_workers` threads. Each window is
+        validated against its input IDs and retried up to `retries` times; a window
+        that still fails keeps its raw text, without affecting the others.
+        `preceding` optionally gives already refined lines spoken just before.
         """
-        if not self.model:
+        if not self.backend:
             return raw_transcripts
 
         if not raw_transcripts:
             return []
 
-        # Prepare the input for the model
-        transcript_text = "\n".join([f"ID {t['id']}: {t['text']}" for t in raw_transcripts])
-        
+        windows = self._refine_windows(raw_transcripts, window_tokens, overlap)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+            results = list(executor.map(
+                lambda window: self._refine_window(agenda, raw_transcripts, *window, retries, preceding),
+                windows,
+            ))
+
+        refined = {}
+        for window_result in results:
+            refined.update(window_result)
+        return [{**t, "text": refined.get(t["id"], t["text"])} for t in raw_transcripts]
+
+    def refine_batch(self, agenda: str, transcripts: List[Dict], context: Optional[List[str]] = None,
+                     retries: int = 2) -> Dict:
+        """
+        Refines `transcripts` as one window, with `context` as the refined lines
+        spoken just before. Returns {id: refined text}; unlike refine_transcript, a
+        failed window (or a missing backend) gives {} instead of the raw text, so a
+        failure is never mistaken for refined text.
+        """
+        if not self.backend or not transcripts:
+            return {}
+        n = len(transcripts)
+        return self._refine_window(agenda, transcripts, 0, 0, n, n, retries, context)
+
+    @staticmethod
+    def _refine_windows(transcripts: List[Dict], window_tokens: int, overlap: int) -> List[tuple]:
+        """
+        Splits transcripts into (context_start, core_start, core_end, context_end)
+        index ranges; core ranges are consecutive and cover every segment once.
+        """
+        windows = []
+        core_start = 0
+        tokens = 0
+        for i, t in enumerate(transcripts):
+            cost = estimate_tokens(t["text"]) + 4  # "ID n: " prefix
+            if i > core_start and tokens + cost > window_tokens:
+                windows.append((core_start, i))
+                core_start, tokens = i, 0
+            tokens += cost
+        windows.append((core_start, len(transcripts)))
+        return [
+            (max(0, start - overlap), start, end, min(len(transcripts), end + overlap))
+            for start, end in windows
+        ]
+
+    def _refine_window(self, agenda: str, transcripts: List[Dict], context_start: int, core_start: int,
+                       core_end: int, context_end: int, retries: int,
+                       preceding: Optional[List[str]] = None) -> Dict:
+        """
+        Refines transcripts[core_start:core_end], showing the overlap segments as
+        context. Returns {id: refined text} for the core segments ({} on failure).
+        """
+        core_ids = [t["id"] for t in transcripts[core_start:core_end]]
+        before_lines = [t["text"] for t in transcripts[context_start:core_start]]
+        if core_start == 0 and preceding:
+            before_lines = list(preceding)
+        before = "\n".join(before_lines)
+        after = "\n".join(t["text"] for t in transcripts[core_end:context_end])
+        transcript_text = "\n".join([f"ID {t['id']}: {t['text']}" for t in transcripts[core_start:core_end]])
+
         prompt = f"""
         You are a professional meeting assistant. Your task is to refine the following raw meeting transcript based on the provided meeting agenda.
         
         Meeting Agenda:
         {agenda}
         
+        Preceding context (do not return):
+        {before or "(start of meeting)"}
+        
         Raw Transcript (ID: Text):
         {transcript_text}
         
+        Following context (do not return):
+        {after or "(end of meeting)"}
+        
         Instructions:
         1. Correct typos, grammatical errors, and ASR (Automatic Speech Recognition) misinterpretations.
         2. Ensure the context aligns with the agenda.
         3. Do NOT change the meaning of the speakers.
         4. IMPORTANT: You must return the result as a valid JSON list of objects.
         5. Each object must have exactly two fields: 'id' (integer, matching the input) and 'text' (string, the refined text).
-        6. Do not output markdown code blocks (like ```json), just the raw JSON string.
+        6. Return exactly one object for every ID in the Raw Transcript and no others.
+        7. Do not output markdown code blocks (like ```json), just the raw JSON string.
         """
         
-        try:
-            response = self.model.generate_content(prompt)
-            text_response = response.text.strip()
-            
-            # Clean up potential markdown formatting
-            if text_response.startswith("```json"):
-                text_response = text_response[7:]
-            if text_response.startswith("```"):
-                text_response = text_response[3:]
-            if text_response.endswith("```"):
-                text_response = text_response[:-3]
-            
-            refined_data = json.loads(text_response)
-            
-            # Validate structure
-            if isinstance(refined_data, list):
-                # Ensure we preserve the original structure/order if possible, 
-                # or just return what the LLM gave if it matches our schema.
-                return refined_data
-            else:
-                print("LLM returned invalid JSON structure (not a list).")
-                return raw_transcripts
-                
-        except Exception as e:
-            print(f"Error refining transcript: {e}")
-            return raw_transcripts
+        for attempt in range(retries + 1):
+            try:
+                response = self._generate(
+                    "refine", prompt, validate=lambda text: self._parse_refined(text, core_ids) is not None
+                )
+                refined = self._parse_refined(response, core_ids)
+                if refined is not None:
+                    return refined
+                print(f"Refine window {core_ids[0]}-{core_ids[-1]}: response does not match the input IDs.")
+            except Exception as e:
+                print(f"Error refining window {core_ids[0]}-{core_ids[-1]}: {e}")
+            if attempt < retries:
+                metrics.inc("llm_retries_total", method="refine")
+                time.sleep(2 ** attempt)
+        metrics.inc("llm_refine_windows_failed_total")
+        return {}
 
-    def generate_minutes(self, agenda: str, refined_transcripts: List[Dict]) -> str:
+    @staticmethod
+    def _parse_refined(text_response: str, ids: List) -> Optional[Dict]:
         """
-        Generates structured meeting minutes in Markdown based on the transcript.
+        Parses a refine response into {id: text}. Returns None unless every one of
+        `ids` is present with a string text; unexpected IDs are ignored.
         """
-        if not self.model:
-            return "Error: Google API Key not configured."
+        text_response = text_response.strip()
+        
+        # Clean up potential markdown formatting
+        if text_response.startswith("```json"):
+            text_response = text_response[7:]
+        if text_response.startswith("```"):
+            text_response = text_response[3:]
+        if text_response.endswith("```"):
+            text_response = text_response[:-3]
+
+        try:
+            refined_data = json.loads(text_response)
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(refined_data, list):
+            return None
+
+        # Match IDs by string so "12" and 12 are the same segment
+        wanted = {str(i): i for i in ids}
+        refined = {}
+        for item in refined_data:
+            if isinstance(item, dict) and isinstance(item.get("text"), str) and str(item.get("id")) in wanted:
+                refined[wanted[str(item["id"])]] = item["text"]
+        return refined if len(refined) == len(wanted) else None
 
+    @staticmethod
+    def _minutes_prompt(agenda: str, refined_transcripts: List[Dict]) -> str:
         transcript_text = "\n".join([f"- {t['text']}" for t in refined_transcripts])
         
-        prompt = f"""
+        return f"""
         You are a professional minute-taker. Generate a structured meeting minutes document in Markdown format based on the provided agenda and transcript.
         
         Meeting Agenda:
@@ -110,21 +286,10 @@ class LLMService:
         ## Action Items (Who, What, When)
         ## Decisions Made
         """
-        
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            return f"Error generating minutes: {e}"
 
-    def answer_question(self, context: str, question: str) -> str:
-        """
-        Answers a question based on the provided context using Gemini.
-        """
-        if not self.model:
-            return "Error: Google API Key not configured."
-
-        prompt = f"""
+    @staticmethod
+    def _answer_prompt(context: str, question: str) -> str:
+        return f"""
         You are a helpful meeting assistant. Answer the user's question based ONLY on the provided meeting context.
         If the answer is not in the context, say "I don't have enough information from the meeting to answer that."
         
@@ -134,10 +299,163 @@ class LLMService:
         User Question:
         {question}
         """
+
+    @staticmethod
+    def _section_prompt(agenda: str, section: List[Dict]) -> str:
+        transcript_text = "\n".join([f"- {t['text']}" for t in section])
+        agenda_item = section[0].get("agenda_item")
+        focus = f"This part of the meeting covers the agenda item: {agenda_item}" if agenda_item else ""
+        
+        return f"""
+        You are a professional minute-taker. Summarize the following part of a meeting transcript as notes for the final minutes.
+        {focus}
+        
+        Meeting Agenda:
+        {agenda}
+        
+        Transcript Excerpt:
+        {transcript_text}
+        
+        Return concise Markdown bullet points under these headings, omitting empty ones:
+        Discussion, Action Items (Who, What, When), Decisions.
+        """
+
+    @staticmethod
+    def _reduce_prompt(agenda: str, summaries: List[str]) -> str:
+        sections = "\n\n".join(f"### Part {i + 1}\n{summary}" for i, summary in enumerate(summaries))
+        
+        return f"""
+        You are a professional minute-taker. Generate a structured meeting minutes document in Markdown format based on the provided agenda and the notes taken on each part of the meeting, in order.
         
+        Meeting Agenda:
+        {agenda}
+        
+        Notes per Part:
+        {sections}
+        
+        The output should be a well-formatted Markdown document including:
+        # Meeting Minutes
+        ## Date: [Current Date]
+        ## Executive Summary
+        ## Key Discussion Points (aligned with Agenda)
+        ## Action Items (Who, What, When)
+        ## Decisions Made
+        """
+
+    @staticmethod
+    def _minutes_sections(transcripts: List[Dict], section_tokens: int) -> List[List[Dict]]:
+        """
+        Splits transcripts into sections of at most about `section_tokens` tokens.
+        A new section starts whenever agenda_item changes. Otherwise boundaries are
+        content-defined: after a segment whose text hash hits 1 in 8 once the
+        section holds half the budget. An edit then only moves the boundaries of
+        its own section, so the other sections keep their cached summaries.
+        """
+        sections = []
+        current = []
+        tokens = 0
+        for t in transcripts:
+            if current and t.get("agenda_item") != current[-1].get("agenda_item"):
+                sections.append(current)
+                current, tokens = [], 0
+            current.append(t)
+            tokens += estimate_tokens(t["text"]) + 2
+            boundary = int(hashlib.sha256(t["text"].encode("utf-8")).hexdigest()[:8], 16) % 8 == 0
+            if tokens >= section_tokens or (boundary and tokens >= section_tokens // 2):
+                sections.append(current)
+                current, tokens = [], 0
+        if current:
+            sections.append(current)
+        return sections
+
+    def _minutes_reduce_prompt(self, agenda: str, refined_transcripts: List[Dict], section_tokens: int,
+                               max_workers: int) -> str:
+        """
+        Map step of hierarchical minutes: summarizes the sections concurrently (each
+        summary is cached by its prompt, i.e. by the section contents) and returns
+        the prompt for the reduce call.
+        """
+        sections = self._minutes_sections(refined_transcripts, section_tokens)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(sections))) as executor:
+            summaries = list(executor.map(
+                lambda section: self._generate("minutes_section", self._section_prompt(agenda, section)),
+                sections,
+            ))
+        return self._reduce_prompt(agenda, summaries)
+
+    def _use_hierarchical(self, refined_transcripts: List[Dict], hierarchical: Optional[bool],
+                          section_tokens: int) -> bool:
+        if hierarchical is not None:
+            return hierarchical
+        return sum(estimate_tokens(t["text"]) + 2 for t in refined_transcripts) > section_tokens
+
+    def generate_minutes(self, agenda: str, refined_transcripts: List[Dict], hierarchical: Optional[bool] = None,
+                         section_tokens: int = 2000, max_workers: int = 4) -> str:
+        """
+        Generates structured meeting minutes in Markdown based on the transcript.
+
+        Transcripts longer than `section_tokens` (or any, with `hierarchical=True`)
+        are summarized section by section, concurrently, and the minutes are
+        written from the section summaries. After an edit, only the sections whose
+        contents changed are summarized again.
+        """
+        if not self.backend:
+            return "Error: LLM backend not configured (set GOOGLE_API_KEY or LLM_BACKEND)."
+
+        try:
+            if self._use_hierarchical(refined_transcripts, hierarchical, section_tokens):
+                prompt = self._minutes_reduce_prompt(agenda, refined_transcripts, section_tokens, max_workers)
+                return self._generate("minutes_reduce", prompt)
+            return self._generate("minutes", self._minutes_prompt(agenda, refined_transcripts))
+        except Exception as e:
+            return f"Error generating minutes: {e}"
+
+    def stream_minutes(self, agenda: str, refined_transcripts: List[Dict],
+                       cancel_event: Optional[threading.Event] = None, hierarchical: Optional[bool] = None,
+                       section_tokens: int = 2000, max_workers: int = 4) -> Iterator[str]:
+        """
+        Streaming variant of generate_minutes: yields Markdown chunks as they
+        arrive (in hierarchical mode, those of the final reduce call). Stops early
+        once `cancel_event` is set.
+        """
+        if not self.backend:
+            yield "Error: LLM backend not configured (set GOOGLE_API_KEY or LLM_BACKEND)."
+            return
+
         try:
-            response = self.model.generate_content(prompt)
-            return response.text
+            if self._use_hierarchical(refined_transcripts, hierarchical, section_tokens):
+                prompt = self._minutes_reduce_prompt(agenda, refined_transcripts, section_tokens, max_workers)
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                yield from self._stream("minutes_reduce", prompt, cancel_event)
+            else:
+                yield from self._stream("minutes", self._minutes_prompt(agenda, refined_transcripts), cancel_event)
+        except Exception as e:
+            yield f"Error generating minutes: {e}"
+
+    def answer_question(self, context: str, question: str) -> str:
+        """
+        Answers a question based on the provided context using the LLM.
+        """
+        if not self.backend:
+            return "Error: LLM backend not configured (set GOOGLE_API_KEY or LLM_BACKEND)."
+
+        try:
+            return self._generate("answer", self._answer_prompt(context, question))
         except Exception as e:
             return f"Error answering question: {e}"
 
+    def stream_answer(self, context: str, question: str,
+                      cancel_event: Optional[threading.Event] = None) -> Iterator[str]:
+        """
+        Streaming variant of answer_question: yields text chunks as they arrive.
+        Stops early once `cancel_event` is set.
+        """
+        if not self.backend:
+            yield "Error: LLM backend not configured (set GOOGLE_API_KEY or LLM_BACKEND)."
+            return
+
+        try:
+            yield from self._stream("answer", self._answer_prompt(context, question), cancel_event)
+        except Exception as e:
+            yield f"Error answering question: {e}"
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    def __init__(self, reservoir_size=4096):
+        """
+        Keeps exact count/sum/max and the most recent `reservoir_size` observations,
+        from which p50/p95/p99 are computed on snapshot.
+        """
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=reservoir_size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self._recent.append(value)
+
+    def summary(self):
+        values = sorted(self._recent)
+        result = {"count": self.count, "sum": self.sum, "max": self.max}
+        for q in QUANTILES:
+            key = f"p{int(q * 100)}"
+            result[key] = values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Process-wide histograms, counters and gauges. Metric names follow Prometheus
+        conventions (e.g. `stt_decode_seconds`); optional labels are keyword args.
+        """
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._exporters = []
+
+    @staticmethod
+    def _key(name, labels):
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    @contextmanager
+    def time(self, name, **labels):
+        """Records the duration of the block in seconds into histogram `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        """In-process view of all metrics as plain dicts."""
+        with self._lock:
+            return {
+                "timestamp": time.time(),
+                "histograms": {k: h.summary() for k, h in self._histograms.items()},
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+            }
+
+    def values(self, name):
+        """Recent raw observations of histogram `name` across all its label sets."""
+        with self._lock:
+            return [
+                value
+                for key, histogram in self._histograms.items()
+                if key == name or key.startswith(name + "{")
+                for value in histogram._recent
+            ]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def add_exporter(self, exporter, interval=10.0):
+        """
+        Attaches an exporter. Push exporters (with `export(snapshot)`) are called
+        every `interval` seconds on a daemon thread; pull exporters only need
+        `start(registry)`.
+        """
+        if hasattr(exporter, "start"):
+            exporter.start(self)
+        if hasattr(exporter, "export"):
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        exporter.export(self.snapshot())
+                    except Exception as e:
+                        print(f"Error exporting metrics: {e}")
+            threading.Thread(target=loop, daemon=True).start()
+        self._exporters.append(exporter)
+
+
+class JsonLinesExporter:
+    def __init__(self, path):
+        """Appends one JSON snapshot per export interval to `path`."""
+        self.path = path
+
+    def export(self, snapshot):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot) + "\n")
+
+
+def to_prometheus_text(snapshot):
+    """
+    Renders a snapshot in the Prometheus text exposition format. Each metric
+    family gets one `# TYPE` line followed by all of its series; histograms are
+    exposed as summaries (quantiles, _sum and _count).
+    """
+    lines = []
+    for kind, section in (("counter", "counters"), ("gauge", "gauges"), ("summary", "histograms")):
+        families = {}
+        for key, value in snapshot[section].items():
+            name, _, labels = key.partition("{")
+            families.setdefault(name, []).append((labels.rstrip("}"), value))
+        for name in sorted(families):
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(families[name], key=lambda series: series[0]):
+                suffix = "{" + labels + "}" if labels else ""
+                if kind != "summary":
+                    lines.append(f"{name}{suffix} {value}")
+                    continue
+                for q in QUANTILES:
+                    quantile_labels = ",".join(filter(None, [labels, f'quantile="{q}"']))
+                    lines.append(f"{name}{{{quantile_labels}}} {value[f'p{int(q * 100)}']}")
+                lines.append(f"{name}_sum{suffix} {value['sum']}")
+                lines.append(f"{name}_count{suffix} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusExporter:
+    def __init__(self, port=9464, host="0.0.0.0"):
+        """Serves the registry at http://host:port/metrics in Prometheus text format."""
+        self.port = port
+        self.host = host
+        self.server = None
+
+    def start(self, registry):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = to_prometheus_text(registry.snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Prometheus metrics on http://{self.host}:{self.port}/metrics")
+
+
+# Shared registry used by all services
+metrics = MetricsRegistry()
+
+
+def start_exporters_from_env():
+    """
+    Enables exporters from environment variables:
+    METRICS_JSONL_PATH (plus METRICS_EXPORT_INTERVAL, default 10s) and
+    METRICS_PROMETHEUS_PORT.
+    """
+    interval = float(os.getenv("METRICS_EXPORT_INTERVAL", "10"))
+    if os.getenv("METRICS_JSONL_PATH"):
+        metrics.add_exporter(JsonLinesExporter(os.getenv("METRICS_JSONL_PATH")), interval=interval)
+    if os.getenv("METRICS_PROMETHEUS_PORT"):
+        metrics.add_exporter(PrometheusExporter(port=int(os.getenv("METRICS_PROMETHEUS_PORT"))))
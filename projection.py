@@ -0,0 +1,210 @@
+import json
+import os
+import numpy as np
+from sklearn.decomposition import IncrementalPCA
+
+# Fitted IncrementalPCA state, enough to resume partial_fit and transform
+PCA_ARRAYS = ("components_", "mean_", "var_", "explained_variance_", "explained_variance_ratio_",
+              "singular_values_")
+PCA_SCALARS = ("n_samples_seen_", "noise_variance_", "n_components_", "n_features_in_")
+
+
+class ProjectionEngine:
+    def __init__(self, rag_service, cache_path=None, max_display_points=5000, page_size=1000,
+                 refit_growth=0.2, seed=0):
+        """
+        Incremental 3D projection of the transcript collection for the Knowledge Map.
+
+        An IncrementalPCA model is updated page by page as new points appear, and
+        each point's 3D coordinates are cached by point id together with the
+        `embedded_at` of its vector (persisted as `cache_path`.json for the ids and
+        `cache_path`.npz for the coordinates and the model). A refresh rescans the
+        ids only when the service's write generation moved or, for writes by other
+        processes, the collection's count or latest `embedded_at` changed; points
+        whose vector was rewritten are projected again. Once the points fitted since
+        the last full projection exceed `refit_growth` of the collection, all
+        coordinates are recomputed with the updated model, again one page at a time.
+        At most `max_display_points` are returned for display.
+        """
+        self.rag_service = rag_service
+        self.cache_path = cache_path or os.path.join(rag_service.path, f"{rag_service.collection_name}.projection")
+        self.max_display_points = max_display_points
+        self.page_size = page_size
+        self.refit_growth = refit_growth
+        self.seed = seed
+
+        self.pca = IncrementalPCA(n_components=3)
+        self.ids = []
+        self.coords = np.zeros((0, 3), dtype=np.float32)
+        self._row = {}
+        self._versions = {}  # point id -> embedded_at of the projected vector
+        self._pending = []  # vectors waiting for enough samples to partial_fit
+        self._fitted_since_projection = 0
+        self._generation = None  # service generation of the last refresh
+        self._fingerprint = None  # (count, latest embedded_at) of the last refresh
+        self._load()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def refresh(self):
+        """Brings the cached coordinates up to date with the collection."""
+        # Read before scanning: a write during the scan triggers another refresh
+        generation = self.rag_service.generation
+        fingerprint = (self.rag_service.count(), self.rag_service.latest_write())
+        if generation == self._generation and fingerprint == self._fingerprint:
+            return
+
+        live = set()
+        for points in self.rag_service.iter_points(self.page_size, with_vectors=False, with_payload=["embedded_at"]):
+            live.update(p.id for p in points)
+            stale = [
+                p.id for p in points
+                if p.id not in self._row or self._versions.get(p.id) != p.payload.get("embedded_at")
+            ]
+            if stale:
+                records = self.rag_service.client.retrieve(
+                    collection_name=self.rag_service.collection_name,
+                    ids=stale,
+                    with_vectors=True,
+                    with_payload=["embedded_at"],
+                )
+                vectors = np.asarray([r.vector for r in records], dtype=np.float32)
+                self._fit(vectors)
+                # Project with the model as it stands; drift is fixed by _reproject
+                if self._is_fitted():
+                    self._place(records, vectors)
+
+        removed = len(self.ids) - len(live & self._row.keys())
+        if removed:
+            keep = [i for i, point_id in enumerate(self.ids) if point_id in live]
+            self.ids = [self.ids[i] for i in keep]
+            self.coords = self.coords[keep]
+            self._row = {point_id: i for i, point_id in enumerate(self.ids)}
+            self._versions = {point_id: self._versions.get(point_id) for point_id in self.ids}
+
+        if self._is_fitted() and self._fitted_since_projection > self.refit_growth * max(len(live), 1):
+            self._reproject()
+        # Leftovers too small to fit are dropped; unfitted points are retried next time
+        self._pending = []
+        self._generation = generation
+        self._fingerprint = fingerprint
+        self._save()
+
+    def _is_fitted(self):
+        return hasattr(self.pca, "components_")
+
+    def _fit(self, vectors):
+        # partial_fit needs at least n_components samples per call
+        self._pending.append(vectors)
+        pending = np.concatenate(self._pending)
+        if len(pending) >= self.pca.n_components:
+            self.pca.partial_fit(pending)
+            self._fitted_since_projection += len(pending)
+            self._pending = []
+
+    def _place(self, records, vectors):
+        """Projects records: known ids are updated in place, new ones appended."""
+        coords = self.pca.transform(vectors).astype(np.float32)
+        new = []
+        for record, xyz in zip(records, coords):
+            row = self._row.get(record.id)
+            if row is None:
+                new.append(xyz)
+                self._row[record.id] = len(self.ids)
+                self.ids.append(record.id)
+            else:
+                self.coords[row] = xyz
+            self._versions[record.id] = record.payload.get("embedded_at")
+        if new:
+            self.coords = np.vstack([self.coords, np.asarray(new)])
+
+    def _reproject(self):
+        """Recomputes every point's coordinates with the current model, page by page."""
+        ids = []
+        coords = []
+        self._versions = {}
+        for points in self.rag_service.iter_points(self.page_size, with_vectors=True, with_payload=["embedded_at"]):
+            ids.extend(p.id for p in points)
+            self._versions.update((p.id, p.payload.get("embedded_at")) for p in points)
+            coords.append(self.pca.transform(np.asarray([p.vector for p in points], dtype=np.float32)))
+        self.ids = ids
+        self.coords = np.concatenate(coords).astype(np.float32) if coords else np.zeros((0, 3), dtype=np.float32)
+        self._row = {point_id: i for i, point_id in enumerate(ids)}
+        self._fitted_since_projection = 0
+
+    def sample(self):
+        """
+        Returns (ids, coords) of at most `max_display_points` points: everything for
+        small collections, otherwise a fixed-seed uniform sample.
+        """
+        n = len(self.ids)
+        if n <= self.max_display_points:
+            return list(self.ids), self.coords
+        rows = np.sort(np.random.default_rng(self.seed).choice(n, self.max_display_points, replace=False))
+        return [self.ids[i] for i in rows], self.coords[rows]
+
+    def display_points(self):
+        """
+        Returns (coords, texts) for the display sample. Texts are fetched only for
+        the sampled points.
+        """
+        ids, coords = self.sample()
+        texts = {}
+        for i in range(0, len(ids), self.page_size):
+            records = self.rag_service.client.retrieve(
+                collection_name=self.rag_service.collection_name,
+                ids=ids[i:i + self.page_size],
+                with_payload=["text"],
+                with_vectors=False,
+            )
+            texts.update({r.id: r.payload.get("text", "") for r in records})
+        return coords, [texts.get(point_id, "") for point_id in ids]
+
+    def _save(self):
+        state = {
+            "ids": self.ids,
+            "versions": [self._versions.get(point_id) for point_id in self.ids],
+            "fingerprint": self._fingerprint,
+            "fitted_since_projection": self._fitted_since_projection,
+            "pca": {},
+        }
+        arrays = {"coords": self.coords}
+        if self._is_fitted():
+            state["pca"] = {name: np.asarray(getattr(self.pca, name)).item() for name in PCA_SCALARS}
+            arrays.update({name: getattr(self.pca, name) for name in PCA_ARRAYS})
+        # Arrays first: the JSON file is written last and names the point count, so a
+        # crash in between leaves a mismatch that _load rejects
+        with open(self.cache_path + ".npz.tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(self.cache_path + ".npz.tmp", self.cache_path + ".npz")
+        with open(self.cache_path + ".json.tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(self.cache_path + ".json.tmp", self.cache_path + ".json")
+
+    def _load(self):
+        if not (os.path.exists(self.cache_path + ".json") and os.path.exists(self.cache_path + ".npz")):
+            return
+        try:
+            with open(self.cache_path + ".json", encoding="utf-8") as f:
+                state = json.load(f)
+            with np.load(self.cache_path + ".npz") as arrays:
+                coords = arrays["coords"]
+                pca = {name: arrays[name] for name in PCA_ARRAYS if name in arrays}
+            if len(coords) != len(state["ids"]):
+                raise ValueError(f"{len(state['ids'])} ids but {len(coords)} coordinates")
+        except Exception as e:
+            print(f"Ignoring unreadable projection cache: {e}")
+            return
+        for name, value in {**pca, **state["pca"]}.items():
+            setattr(self.pca, name, value)
+        self.ids = state["ids"]
+        self.coords = coords
+        self._fitted_since_projection = state["fitted_since_projection"]
+        self._row = {point_id: i for i, point_id in enumerate(self.ids)}
+        # Caches without versions re-project every point that has one
+        self._versions = dict(zip(self.ids, state.get("versions") or [None] * len(self.ids)))
+        # Writes since the cache was saved, in this process or another, show up in
+        # the fingerprint, so the generation can start from the current one
+        self._fingerprint = tuple(state["fingerprint"]) if state.get("fingerprint") else None
+        self._generation = self.rag_service.generation
@@ -1,19 +1,139 @@
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import (
+    Batch,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    DatetimeRange,
+    Direction,
+    Distance,
+    FieldCondition,
+    Filter,
+    HasIdCondition,
+    MatchValue,
+    OrderBy,
+    PayloadSchemaType,
+    PointStruct,
+    QuantizationSearchParams,
+    Range,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    VectorParams,
+)
+import contextlib
+import os
+import threading
+import time
 import uuid
 import datetime
+from embedding_backends import load_encoder
+from dedup import DEFAULT_HALLUCINATIONS, DuplicateFilter, collapse_repeats
+from embedding_cache import EmbeddingCache
+from ingest_queue import IngestQueue
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from metrics import metrics
+
+# Structured payload stored with every transcript point (besides "text"), and the
+# Qdrant index type for each field so filtered searches only touch the subset.
+PAYLOAD_INDEXES = {
+    "meeting_id": PayloadSchemaType.KEYWORD,
+    "seq": PayloadSchemaType.INTEGER,
+    "audio_start": PayloadSchemaType.FLOAT,
+    "audio_end": PayloadSchemaType.FLOAT,
+    "language": PayloadSchemaType.KEYWORD,
+    "agenda_item": PayloadSchemaType.KEYWORD,
+    "timestamp": PayloadSchemaType.DATETIME,
+    # Set whenever a point's vector is written; see RAGService.latest_write
+    "embedded_at": PayloadSchemaType.FLOAT,
+}
+# Keyword fields the BM25 index keeps doc-id sets for, so filtered lexical search
+# scores only the matching transcripts
+LEXICAL_FIELDS = ("meeting_id", "language", "agenda_item")
+
+def quantization_config(vector_quantization):
+    """Qdrant quantization config for None, "scalar" (int8) or "binary" (1 bit/dim)."""
+    if vector_quantization is None:
+        return None
+    if vector_quantization == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if vector_quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown vector_quantization: {vector_quantization}")
+
+
+def quantization_search_params(vector_quantization, oversampling=2.0):
+    """Searches quantized vectors, then rescores the top candidates with float32 ones."""
+    if vector_quantization is None:
+        return None
+    return SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=oversampling))
+
 
 class RAGService:
-    def __init__(self, collection_name="meeting_transcripts", path="./qdrant_data"):
+    def __init__(self, collection_name="meeting_transcripts", path="./qdrant_data",
+                 model_name="all-MiniLM-L6-v2", embedding_cache_path="./embedding_cache.sqlite",
+                 retrieval_mode="hybrid", url=None, embedding_backend="torch",
+                 vector_quantization=None, quantization_oversampling=2.0, dedup=True,
+                 dedup_threshold=0.95, dedup_mode="drop", hallucination_blocklist=DEFAULT_HALLUCINATIONS):
+        """
+        retrieval_mode: "dense" (vector search only), "lexical" (BM25 only) or "hybrid"
+        (both, fused with reciprocal-rank fusion). The BM25 index is kept next to the
+        collection in `path` and updated on every upsert.
+
+        `url` connects to a Qdrant server instead of the local `path` store; payload
+        indexes (see PAYLOAD_INDEXES) only take effect on a server.
+
+        `embedding_backend` is "torch", "onnx", "onnx-int8" or the model-free "hash"
+        stand-in (see embedding_backends).
+        `vector_quantization` ("scalar" for int8, "binary" for 1 bit per dimension)
+        applies when the collection is created: the quantized vectors are searched
+        in RAM and the top `quantization_oversampling` x limit candidates are
+        rescored with the original float32 vectors.
+
+        With `dedup`, looped phrases are collapsed (the original is kept as
+        `raw_text`), texts consisting only of `hallucination_blocklist` phrases are
+        dropped, and a transcript whose embedding is within `dedup_threshold` cosine
+        similarity of a recent one from the same meeting (or, without a meeting_id,
+        the same batch) is not stored. `dedup_mode="merge"` instead folds it into
+        the earlier point (repeat_count, audio_end).
+        """
         self.collection_name = collection_name
-        self.client = QdrantClient(path=path)
+        self.path = path
+        self.retrieval_mode = retrieval_mode
+        self.client = QdrantClient(url=url) if url else QdrantClient(path=path)
+        # The embedded (local) Qdrant is not thread-safe; a server takes parallel upserts
+        self._local_write_lock = None if url else threading.Lock()
+        # Bumped on every write, so readers (e.g. the projection) can tell whether anything changed
+        self.generation = 0
+        self._generation_lock = threading.Lock()
         # Using a lightweight model for local embedding
         print("Loading embedding model...")
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2') 
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self.encoder = load_encoder(model_name, backend=embedding_backend)
+        self.vector_size = self.encoder.get_sentence_embedding_dimension()
         print("Embedding model loaded.")
+        # Repeated questions and re-saved transcripts are served from the cache.
+        # Quantized backends produce slightly different vectors, so they get their own keys.
+        cache_model = model_name if embedding_backend == "torch" else f"{model_name}@{embedding_backend}"
+        self.embedding_cache = EmbeddingCache(cache_model, path=embedding_cache_path)
         
+        self.vector_quantization = vector_quantization
+        self.search_params = quantization_search_params(vector_quantization, quantization_oversampling)
+        self.dedup_mode = dedup_mode
+        self.duplicate_filter = DuplicateFilter(dedup_threshold, blocklist=hallucination_blocklist) if dedup else None
+
         self._init_collection()
+        os.makedirs(path, exist_ok=True)
+        self.lexical_index = BM25Index(os.path.join(path, f"{collection_name}.bm25.jsonl"), fields=LEXICAL_FIELDS)
+        self._backfill_lexical_index()
+        # Asynchronous write path: micro-batched, spooled to disk until stored
+        self.ingest_queue = IngestQueue(
+            lambda texts, payloads, ids: self.batch_add_transcripts(texts, payloads=payloads, ids=ids),
+            spool_path=os.path.join(path, f"{collection_name}.spool.jsonl"),
+        )
 
     def _init_collection(self):
         collections = self.client.get_collections()
@@ -24,76 +144,406 @@ class RAGService:
             # all-MiniLM-L6-v2 produces 384-dimensional vectors
             self.client.create_collection(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(size=384, distance=Distance.COSINE),
+                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE),
+                quantization_config=quantization_config(self.vector_quantization),
             )
         else:
             print(f"Collection {self.collection_name} already exists.")
 
-    def add_transcript(self, text):
+        # Idempotent; also upgrades collections created before the payload schema
+        existing = self.client.get_collection(self.collection_name).payload_schema or {}
+        for field, schema in PAYLOAD_INDEXES.items():
+            if field not in existing:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field,
+                    field_schema=schema,
+                )
+
+    @staticmethod
+    def build_filter(meeting_id=None, language=None, agenda_item=None, since=None, until=None):
+        """
+        Builds a Qdrant filter from the structured payload fields. `since`/`until`
+        (datetime or ISO string) bound the stored timestamp: since <= t < until.
+        Returns None when no condition is given.
+        """
+        conditions = []
+        for field, value in (("meeting_id", meeting_id), ("language", language), ("agenda_item", agenda_item)):
+            if value is not None:
+                conditions.append(FieldCondition(key=field, match=MatchValue(value=value)))
+        if since is not None or until is not None:
+            if isinstance(since, str):
+                since = datetime.datetime.fromisoformat(since)
+            if isinstance(until, str):
+                until = datetime.datetime.fromisoformat(until)
+            conditions.append(FieldCondition(key="timestamp", range=DatetimeRange(gte=since, lt=until)))
+        return Filter(must=conditions) if conditions else None
+
+    @staticmethod
+    def _make_payload(text, meeting_id=None, seq=None, audio_start=None, audio_end=None,
+                      language=None, agenda_item=None):
+        payload = {"text": text, "timestamp": datetime.datetime.now().isoformat()}
+        fields = {
+            "meeting_id": meeting_id,
+            "seq": seq,
+            "audio_start": audio_start,
+            "audio_end": audio_end,
+            "language": language,
+            "agenda_item": agenda_item,
+        }
+        payload.update({k: v for k, v in fields.items() if v is not None})
+        return payload
+
+    def _backfill_lexical_index(self):
+        """
+        Builds the BM25 index from stored payloads if it is missing or behind, e.g.
+        for collections created before hybrid retrieval existed, or if it lacks the
+        LEXICAL_FIELDS values (logs written before they were indexed).
+        """
+        count = self.client.count(collection_name=self.collection_name).count
+        if len(self.lexical_index) >= count and not self.lexical_index.missing_fields:
+            return
+        print(f"Indexing {count} stored transcripts for lexical search...")
+        for points in self.iter_points(with_vectors=False, with_payload=["text", *LEXICAL_FIELDS]):
+            self.lexical_index.add_many([(p.id, p.payload.get("text", ""), p.payload) for p in points])
+
+    def _encode(self, texts, op):
+        """
+        Encodes texts through the embedding cache. Returns a float32 array.
+        """
+        with metrics.time("rag_encode_seconds", op=op):
+            return self.embedding_cache.encode(self.encoder, texts)
+
+    def encode_query(self, text):
+        """Embeds a search query the way search() does. Returns a float32 vector."""
+        return self._encode([text], op="query")[0]
+
+    def add_transcript(self, text, **fields):
+        """
+        Stores one transcript. `fields` are structured payload fields
+        (meeting_id, seq, audio_start, audio_end, language, agenda_item).
+        """
         if not text or not text.strip():
             return
             
-        vector = self.encoder.encode(text).tolist()
-        point_id = str(uuid.uuid4())
-        timestamp = datetime.datetime.now().isoformat()
-        
-        point = PointStruct(
-            id=point_id,
-            vector=vector,
-            payload={"text": text, "timestamp": timestamp}
-        )
-        
-        self.client.upsert(
-            collection_name=self.collection_name,
-            points=[point]
-        )
-        print(f"Stored transcript: {text[:30]}...")
+        if self._store([(str(uuid.uuid4()), text, self._make_payload(text, **fields))], op="add"):
+            print(f"Stored transcript: {text[:30]}...")
 
-    def batch_add_transcripts(self, texts):
+    def batch_add_transcripts(self, texts, payloads=None, ids=None, meeting_id=None, language=None):
         """
         Batch insert multiple transcripts into Qdrant.
+        `payloads` optionally holds structured payload fields per text (seq, audio
+        timestamps, agenda_item, ...); `meeting_id` and `language` apply to every text
+        that doesn't set its own, and `seq` defaults to the position in `texts`.
+        `ids` optionally fixes point ids so re-ingesting the same items overwrites
+        instead of duplicating.
         """
         if not texts:
             return
 
-        points = []
-        # Batch encode texts for efficiency
-        vectors = self.encoder.encode(texts).tolist()
-        
+        items = []
         for i, text in enumerate(texts):
             if not text or not text.strip():
                 continue
                 
-            point_id = str(uuid.uuid4())
-            timestamp = datetime.datetime.now().isoformat()
-            
-            points.append(PointStruct(
-                id=point_id,
-                vector=vectors[i],
-                payload={"text": text, "timestamp": timestamp}
-            ))
+            point_id = ids[i] if ids else str(uuid.uuid4())
+            payload = self._make_payload(text, meeting_id=meeting_id, seq=i, language=language)
+            if payloads:
+                payload.update(payloads[i])
+            items.append((point_id, text, payload))
         
-        if points:
+        stored = self._store(items, op="batch")
+        if stored:
+            print(f"Batch stored {stored} transcripts.")
+
+    def _store(self, items, op):
+        """
+        Encodes and upserts [(point_id, text, payload), ...] after the dedup stage.
+        Returns the number of points stored.
+        """
+        if self.duplicate_filter:
+            cleaned = []
+            for point_id, raw_text, payload in items:
+                text = collapse_repeats(raw_text)
+                if self.duplicate_filter.is_hallucination(text):
+                    metrics.inc("rag_hallucinations_dropped_total")
+                    continue
+                payload["text"] = text
+                if text != raw_text:
+                    # The collapsed text is embedded and indexed; the original is kept
+                    payload["raw_text"] = raw_text
+                cleaned.append((point_id, text, payload))
+            items = cleaned
+        if not items:
+            return 0
+
+        # Batch encode texts for efficiency; cached texts are not re-encoded
+        vectors = self._encode([text for _, text, _ in items], op=op)
+        if self.duplicate_filter:
+            items, vectors = self._drop_duplicates(items, vectors)
+            if not items:
+                return 0
+
+        embedded_at = time.time()
+        for _, _, payload in items:
+            payload["embedded_at"] = embedded_at
+        points = [
+            PointStruct(id=point_id, vector=vector.tolist(), payload=payload)
+            for (point_id, _, payload), vector in zip(items, vectors)
+        ]
+        with metrics.time("rag_upsert_seconds"):
             self.client.upsert(
                 collection_name=self.collection_name,
                 points=points
             )
-            print(f"Batch stored {len(points)} transcripts.")
+        metrics.inc("rag_points_upserted_total", len(points))
+        self.lexical_index.add_many([(p.id, p.payload["text"], p.payload) for p in points])
+        self._bump_generation()
+        return len(points)
+
+    def upsert_points(self, ids, payloads, vectors=None):
+        """
+        Bulk write path for restores and migrations: stores the points as given,
+        without the dedup stage. `vectors` is a float32 array, one row per point;
+        without it the payload texts are re-embedded with this service's model.
+        Returns the number of points stored.
+        """
+        if not ids:
+            return 0
+        if vectors is None:
+            vectors = self._encode([payload["text"] for payload in payloads], op="import")
+        embedded_at = time.time()
+        payloads = [dict(payload, embedded_at=embedded_at) for payload in payloads]
+        with self._local_write_lock or contextlib.nullcontext(), metrics.time("rag_upsert_seconds"):
+            self.client.upsert(
+                collection_name=self.collection_name,
+                points=Batch(ids=list(ids), vectors=vectors.tolist(), payloads=list(payloads)),
+            )
+        metrics.inc("rag_points_upserted_total", len(ids))
+        self.lexical_index.add_many([(i, payload["text"], payload) for i, payload in zip(ids, payloads)])
+        self._bump_generation()
+        return len(ids)
 
-    def query(self, query_text, limit=3):
-        vector = self.encoder.encode(query_text).tolist()
+    def _bump_generation(self):
+        with self._generation_lock:
+            self.generation += 1
+
+    def _drop_duplicates(self, items, vectors):
+        """
+        Removes near-duplicates of recent transcripts. In "merge" mode each kept
+        point absorbs the repeat count and audio end of its duplicates; points
+        stored earlier are updated in place.
+        """
+        # Without a meeting_id the batch is its own scope, so unrelated ingests
+        # never suppress each other
+        batch_scope = object()
+        duplicate_of = self.duplicate_filter.filter(
+            [point_id for point_id, _, _ in items],
+            vectors,
+            [batch_scope if payload.get("meeting_id") is None else payload["meeting_id"] for _, _, payload in items],
+        )
+        keep = [i for i, target in enumerate(duplicate_of) if target is None]
+        dropped = len(items) - len(keep)
+        if not dropped:
+            return items, vectors
+        metrics.inc("rag_duplicates_dropped_total", dropped)
+
+        if self.dedup_mode == "merge":
+            duplicates = {}
+            for i, target in enumerate(duplicate_of):
+                if target is not None:
+                    duplicates.setdefault(target, []).append(items[i][2])
+            payloads = {items[i][0]: items[i][2] for i in keep}
+            earlier = [target for target in duplicates if target not in payloads]
+            if earlier:
+                records = self.client.retrieve(
+                    collection_name=self.collection_name, ids=earlier, with_payload=True, with_vectors=False
+                )
+                payloads.update({r.id: r.payload for r in records})
+            for target, merged in duplicates.items():
+                payload = payloads.get(target)
+                if payload is None:
+                    continue
+                update = {"repeat_count": payload.get("repeat_count", 1) + len(merged)}
+                ends = [p["audio_end"] for p in [payload] + merged if p.get("audio_end") is not None]
+                if ends:
+                    update["audio_end"] = max(ends)
+                payload.update(update)
+                if target in earlier:
+                    self.client.set_payload(collection_name=self.collection_name, payload=update, points=[target])
+
+        return [items[i] for i in keep], vectors[keep]
+
+    def enqueue_transcripts(self, texts, payloads=None, meeting_id=None, language=None):
+        """
+        Non-blocking counterpart of batch_add_transcripts: the transcripts are
+        spooled and stored by a background worker in micro-batches. Payload fields
+        (including the timestamp) are fixed now. Returns the point ids; use flush()
+        to wait until they are searchable.
+        """
+        full_payloads = []
+        for i, text in enumerate(texts):
+            payload = self._make_payload(text, meeting_id=meeting_id, seq=i, language=language)
+            if payloads:
+                payload.update(payloads[i])
+            full_payloads.append(payload)
+        return self.ingest_queue.put(texts, full_payloads)
+
+    def flush(self, timeout=None):
+        """Waits until all enqueued transcripts are stored. Returns False on timeout."""
+        return self.ingest_queue.flush(timeout)
+
+    def query(self, query_text, limit=3, mode=None, **filters):
+        """
+        Returns the texts of the `limit` best matching transcripts.
+        `mode` overrides the service's retrieval_mode for this call. `filters` are
+        passed to build_filter (meeting_id, language, agenda_item, since, until).
+        """
+        return [hit.payload["text"] for hit in self.search(query_text, limit, mode, **filters)]
+
+    def search(self, query_text, limit=3, mode=None, with_vectors=False, **filters):
+        """
+        Like query(), but returns the matching records (id, payload and, with
+        `with_vectors`, the stored vector) best first.
+        """
+        mode = mode or self.retrieval_mode
+        query_filter = self.build_filter(**filters)
+        if mode == "dense":
+            search_result = self._dense_search(query_text, limit, query_filter, with_vectors)
+        else:
+            # Fuse deeper candidate lists than we return so RRF has overlap to work with
+            candidates = max(20, 4 * limit)
+            dense_hits = {}
+            if mode != "lexical":
+                dense_hits = {
+                    hit.id: hit for hit in self._dense_search(query_text, candidates, query_filter, with_vectors)
+                }
+            with metrics.time("rag_lexical_query_seconds"):
+                lexical_ids = self._lexical_search(query_text, candidates, query_filter, filters)
+            if mode == "lexical":
+                ranked = lexical_ids[:limit]
+            else:
+                ranked = reciprocal_rank_fusion([list(dense_hits), lexical_ids])[:limit]
+            missing = [doc_id for doc_id in ranked if doc_id not in dense_hits]
+            if missing:
+                for record in self.client.retrieve(
+                    collection_name=self.collection_name, ids=missing, with_vectors=with_vectors
+                ):
+                    dense_hits[record.id] = record
+            search_result = [dense_hits[doc_id] for doc_id in ranked if doc_id in dense_hits]
+        return search_result
+
+    def _lexical_search(self, query_text, limit, query_filter, filters):
+        """
+        BM25 ids best first, restricted to the filter. Keyword filters are resolved
+        inside the index before the top `limit` are taken; a time range, which the
+        index doesn't hold, is checked on an over-fetched list with one bounded scroll.
+        """
+        where = {field: filters[field] for field in LEXICAL_FIELDS if filters.get(field) is not None}
+        if filters.get("since") is None and filters.get("until") is None:
+            return [doc_id for doc_id, _ in self.lexical_index.search(query_text, limit, where=where)]
+        hits = [doc_id for doc_id, _ in self.lexical_index.search(query_text, 10 * limit, where=where)]
+        matching = self._matching_ids(hits, query_filter)
+        return [doc_id for doc_id in hits if doc_id in matching][:limit]
+
+    def _dense_search(self, query_text, limit, query_filter=None, with_vectors=False):
+        vector = self.encode_query(query_text).tolist()
         
-        search_result = self.client.query_points(
+        with metrics.time("rag_query_seconds"):
+            return self.client.query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                query_filter=query_filter,
+                search_params=self.search_params,
+                with_vectors=with_vectors,
+                limit=limit
+            ).points
+
+    def neighbors(self, hits, radius=1):
+        """
+        Returns the stored segments within `radius` seq positions of each hit in the
+        same meeting (hits included), fetched with one filtered scroll. Hits without
+        meeting_id/seq have no neighbors.
+        """
+        windows = []
+        for hit in hits:
+            meeting_id = hit.payload.get("meeting_id")
+            seq = hit.payload.get("seq")
+            if meeting_id is None or seq is None:
+                continue
+            windows.append(Filter(must=[
+                FieldCondition(key="meeting_id", match=MatchValue(value=meeting_id)),
+                FieldCondition(key="seq", range=Range(gte=seq - radius, lte=seq + radius)),
+            ]))
+        if not windows:
+            return []
+        records = []
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=Filter(should=windows),
+                limit=1000,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            records.extend(points)
+            if offset is None:
+                return records
+
+    def _matching_ids(self, ids, query_filter):
+        """
+        The subset of `ids` whose points match the filter, in one scroll bounded by
+        len(ids).
+        """
+        if not ids:
+            return set()
+        points, _ = self.client.scroll(
             collection_name=self.collection_name,
-            query=vector,
-            limit=limit
-        ).points
-        
-        results = []
-        for hit in search_result:
-            results.append(hit.payload["text"])
-            
-        return results
+            scroll_filter=Filter(must=[HasIdCondition(has_id=list(ids)), query_filter]),
+            limit=len(ids),
+            with_payload=False,
+            with_vectors=False,
+        )
+        return {p.id for p in points}
+
+    def count(self):
+        return self.client.count(collection_name=self.collection_name, exact=True).count
+
+    def latest_write(self):
+        """
+        `embedded_at` of the most recently written vector (None if there is none),
+        read with one ordered scroll. Together with count() a cheap change check
+        that also sees writes made by other processes.
+        """
+        points, _ = self.client.scroll(
+            collection_name=self.collection_name,
+            limit=1,
+            order_by=OrderBy(key="embedded_at", direction=Direction.DESC),
+            with_payload=["embedded_at"],
+            with_vectors=False,
+        )
+        return points[0].payload["embedded_at"] if points else None
+
+    def iter_points(self, page_size=1000, with_vectors=True, with_payload=True):
+        """
+        Streams the whole collection page by page, so callers never hold more than
+        one page of points in memory. Yields lists of records.
+        """
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                limit=page_size,
+                offset=offset,
+                with_vectors=with_vectors,
+                with_payload=with_payload,
+            )
+            if points:
+                yield points
+            if offset is None:
+                return
 
     def get_all_vectors(self, limit=100):
         """
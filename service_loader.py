@@ -0,0 +1,65 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from metrics import metrics
+
+
+class ServiceLoader:
+    def __init__(self, max_workers=4):
+        """
+        Builds slow services (the ones that load models) on background threads, so
+        the UI can render while they load. Services submitted together load
+        concurrently; `ready` tells whether they can be used yet and `get` waits
+        for one.
+        """
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup")
+        self._futures = {}
+        self._started = {}
+        self._seconds = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name, factory):
+        """Starts building `name` with `factory()` unless it is already loading or loaded."""
+        with self._lock:
+            if name not in self._futures:
+                self._started[name] = time.perf_counter()
+                self._futures[name] = self._executor.submit(self._build, name, factory)
+            return self._futures[name]
+
+    def _build(self, name, factory):
+        try:
+            service = factory()
+        except Exception as e:
+            self._seconds[name] = time.perf_counter() - self._started[name]
+            print(f"Error loading {name}: {e}")
+            raise
+        self._seconds[name] = time.perf_counter() - self._started[name]
+        metrics.observe("startup_load_seconds", self._seconds[name], service=name)
+        print(f"{name} loaded in {self._seconds[name]:.1f}s")
+        return service
+
+    def ready(self, *names):
+        """True once the named services (default: all) have loaded successfully."""
+        futures = [self._futures[n] for n in names] if names else list(self._futures.values())
+        return all(f.done() and f.exception() is None for f in futures)
+
+    def done(self):
+        """True once every service has either loaded or failed."""
+        return all(f.done() for f in self._futures.values())
+
+    def get(self, name, timeout=None):
+        """The built service; blocks while it is loading and re-raises its load error."""
+        return self._futures[name].result(timeout)
+
+    def status(self):
+        """{name: {"state": "loading" | "ready" | "failed", "seconds": ..., "error": ...}}"""
+        status = {}
+        for name, future in list(self._futures.items()):
+            if not future.done():
+                state = {"state": "loading", "seconds": time.perf_counter() - self._started[name]}
+            elif future.exception() is not None:
+                state = {"state": "failed", "seconds": self._seconds.get(name), "error": str(future.exception())}
+            else:
+                state = {"state": "ready", "seconds": self._seconds.get(name)}
+            status[name] = state
+        return status
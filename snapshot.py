@@ -0,0 +1,210 @@
+"""
+Snapshot export/import of the transcript collection.
+
+    python snapshot.py export ./snapshots/2024-06-01
+    python snapshot.py import ./snapshots/2024-06-01 --collection restored
+    python snapshot.py import ./snapshots/2024-06-01 --model BAAI/bge-small-en-v1.5 --reembed
+
+A snapshot directory holds:
+- vectors.npy: float32 (points, dim), memory-mappable with np.load(mmap_mode="r")
+- payloads.parquet: one row per point (id, text and the structured payload fields),
+  in the same order as the vectors, one row group per exported page
+- manifest.json: collection, embedding model, vector size and point count
+
+Export and import stream page by page, so memory stays bounded by the page and
+batch sizes regardless of the collection size. Import upserts in parallel
+batches; with --reembed the stored texts are encoded with the target model
+instead of loading the vectors, e.g. after changing the embedding model.
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from numpy.lib.format import open_memmap
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.npy"
+PAYLOADS_FILE = "payloads.parquet"
+# Known payload fields get their own typed column; anything else goes into
+# "extra" as JSON, so no field is lost
+PAYLOAD_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("text", pa.string()),
+    ("timestamp", pa.string()),
+    ("meeting_id", pa.string()),
+    ("seq", pa.int64()),
+    ("audio_start", pa.float64()),
+    ("audio_end", pa.float64()),
+    ("language", pa.string()),
+    ("agenda_item", pa.string()),
+    ("repeat_count", pa.int64()),
+    ("source_file", pa.string()),
+    ("extra", pa.string()),
+])
+PAYLOAD_FIELDS = [name for name in PAYLOAD_SCHEMA.names if name not in ("id", "extra")]
+
+
+def _payload_row(point_id, payload):
+    row = {"id": str(point_id)}
+    row.update({field: payload.get(field) for field in PAYLOAD_FIELDS})
+    extra = {k: v for k, v in payload.items() if k not in PAYLOAD_FIELDS}
+    row["extra"] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return row
+
+
+def _point_from_row(row):
+    """Returns (point_id, payload) for a row of payloads.parquet."""
+    point_id = row["id"]
+    # Qdrant ids are unsigned integers or UUIDs
+    point_id = int(point_id) if point_id.isdigit() else point_id
+    payload = {field: row[field] for field in PAYLOAD_FIELDS if row[field] is not None}
+    if row["extra"]:
+        payload.update(json.loads(row["extra"]))
+    return point_id, payload
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+    return manifest
+
+
+def export_snapshot(rag_service, path, page_size=4096):
+    """
+    Writes the collection of `rag_service` to the directory `path`, one scroll
+    page at a time. Points added during the export are left out. Returns the
+    manifest.
+    """
+    started = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+    collection = rag_service.client.get_collection(rag_service.collection_name)
+    vector_size = collection.config.params.vectors.size
+    total = rag_service.count()
+
+    vectors = open_memmap(os.path.join(path, VECTORS_FILE), mode="w+", dtype=np.float32,
+                          shape=(total, vector_size))
+    writer = pq.ParquetWriter(os.path.join(path, PAYLOADS_FILE), PAYLOAD_SCHEMA, compression="zstd")
+    exported = 0
+    try:
+        for points in rag_service.iter_points(page_size=page_size):
+            points = points[:total - exported]
+            if not points:
+                break
+            vectors[exported:exported + len(points)] = np.asarray([p.vector for p in points], dtype=np.float32)
+            writer.write_table(pa.Table.from_pylist([_payload_row(p.id, p.payload) for p in points],
+                                                    schema=PAYLOAD_SCHEMA))
+            exported += len(points)
+            print(f"Exported {exported}/{total} points")
+    finally:
+        writer.close()
+        vectors.flush()
+        del vectors
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "created": datetime.datetime.now().isoformat(),
+        "collection": rag_service.collection_name,
+        "model_name": rag_service.model_name,
+        "embedding_backend": rag_service.embedding_backend,
+        "vector_size": vector_size,
+        "distance": "cosine",
+        # Rows of vectors.npy beyond this (points deleted during the export) are unused
+        "points": exported,
+        "files": {"vectors": VECTORS_FILE, "payloads": PAYLOADS_FILE},
+    }
+    with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Exported {exported} points to {path} in {time.perf_counter() - started:.1f}s")
+    return manifest
+
+
+def import_snapshot(rag_service, path, reembed=False, batch_size=2048, workers=4):
+    """
+    Upserts a snapshot into the collection of `rag_service`. Batches of
+    `batch_size` points are written by `workers` threads, with at most two
+    batches per worker read ahead. With `reembed`, texts are encoded with the
+    service's model instead of reusing the stored vectors. Returns the number of
+    points imported.
+    """
+    started = time.perf_counter()
+    manifest = read_manifest(path)
+    if not reembed:
+        if manifest["vector_size"] != rag_service.vector_size:
+            raise ValueError(
+                f"Snapshot vectors have {manifest['vector_size']} dimensions, the collection "
+                f"{rag_service.vector_size}; import with reembed=True to encode the texts again"
+            )
+        if manifest["model_name"] != rag_service.model_name:
+            raise ValueError(
+                f"Snapshot was embedded with {manifest['model_name']}, the service uses "
+                f"{rag_service.model_name}; import with reembed=True to encode the texts again"
+            )
+    vectors = None if reembed else np.load(os.path.join(path, manifest["files"]["vectors"]), mmap_mode="r")
+    payloads = pq.ParquetFile(os.path.join(path, manifest["files"]["payloads"]))
+
+    total = manifest["points"]
+    offset = 0
+    imported = 0
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for batch in payloads.iter_batches(batch_size=batch_size):
+            rows = batch.to_pylist()[:total - offset]
+            if not rows:
+                break
+            ids, batch_payloads = zip(*(_point_from_row(row) for row in rows))
+            # Copies just this batch out of the memory map
+            batch_vectors = None if vectors is None else np.array(vectors[offset:offset + len(rows)])
+            offset += len(rows)
+            pending.append(pool.submit(rag_service.upsert_points, list(ids), list(batch_payloads), batch_vectors))
+            while len(pending) >= 2 * workers:
+                imported += pending.popleft().result()
+                print(f"Imported {imported}/{total} points")
+        while pending:
+            imported += pending.popleft().result()
+    print(f"Imported {imported} points into {rag_service.collection_name} in {time.perf_counter() - started:.1f}s")
+    return imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a snapshot of the transcript collection.")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("snapshot_dir")
+    parser.add_argument("--collection", default="meeting_transcripts")
+    parser.add_argument("--path", default="./qdrant_data", help="Local Qdrant store")
+    parser.add_argument("--url", default=os.getenv("QDRANT_URL"), help="Qdrant server instead of --path")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Embedding model of the collection")
+    parser.add_argument("--embedding-backend", default=os.getenv("EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--page-size", type=int, default=4096, help="Points per export page")
+    parser.add_argument("--batch-size", type=int, default=2048, help="Points per import upsert")
+    parser.add_argument("--workers", type=int, default=4, help="Parallel import upserts")
+    parser.add_argument("--reembed", action="store_true", help="Encode the stored texts with --model on import")
+    args = parser.parse_args()
+
+    from rag_service import RAGService
+
+    rag_service = RAGService(
+        collection_name=args.collection,
+        path=args.path,
+        url=args.url,
+        model_name=args.model,
+        embedding_backend=args.embedding_backend,
+    )
+    if args.command == "export":
+        export_snapshot(rag_service, args.snapshot_dir, page_size=args.page_size)
+    else:
+        import_snapshot(rag_service, args.snapshot_dir, reembed=args.reembed,
+                        batch_size=args.batch_size, workers=args.workers)
+    rag_service.ingest_queue.close()
+
+
+if __name__ == "__main__":
+    main()
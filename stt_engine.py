@@ -0,0 +1,390 @@
+"""
+Multi-session speech-to-text: one shared Whisper model serves many concurrent
+recordings (browser sessions, or file-backed sessions in load tests).
+
+    python stt_engine.py --model small --language zh meeting1.wav meeting2.wav
+
+replays each file as its own real-time session and prints the transcripts and
+per-session latency as JSON.
+"""
+import argparse
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+import numpy as np
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.tokenizer import Tokenizer
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from audio_source import AudioRingBuffer, MicrophoneSource, SAMPLE_RATE, WavFileSource
+from metrics import Histogram, metrics
+from stt_service import default_device, load_whisper_model
+
+# Whisper decodes at most 30 seconds per pass
+MAX_CHUNK_SECONDS = 30.0
+
+
+class STTSession:
+    def __init__(self, engine, session_id, source=None, language="zh", buffer_seconds=120.0):
+        """
+        One recording served by an STTEngine. Mirrors the STTService recording API
+        (start_recording / stop_recording / wait, `transcript_queue`, `language`,
+        `lag_seconds`, `partial_text`) so the app can use either.
+        """
+        self.engine = engine
+        self.session_id = session_id
+        self.source = source
+        self.language = language
+        self.ring = AudioRingBuffer(int(buffer_seconds * SAMPLE_RATE))
+        self.transcript_queue = queue.Queue()
+        # Chunked decoding has no provisional text; kept for API compatibility
+        self.partial_text = ""
+        # Seconds from the end of a chunk being captured to its text being delivered
+        self.latency = Histogram()
+        self.lag_seconds = 0.0
+        self.dropped_samples = 0
+        self.running = False
+        self.record_thread = None
+        self._chunk_start = 0
+        self._ready = deque()  # (start, end, captured_at) chunks waiting for the scheduler
+        self._in_flight = 0
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        """Marks the session as in use; sessions idle for the engine's `idle_seconds` are closed."""
+        self.last_active = time.monotonic()
+
+    def set_language(self, language):
+        self.language = language
+
+    def start_recording(self):
+        if self.source is None:
+            self.source = MicrophoneSource()
+        self.touch()
+        self.running = True
+        self._chunk_start = self.ring.total_written
+        self.record_thread = threading.Thread(target=self._record_audio, daemon=True)
+        self.record_thread.start()
+
+    def stop_recording(self):
+        self.running = False
+        self.wait()
+
+    def wait(self, timeout=None):
+        """Blocks until capture has ended and every chunk has been transcribed."""
+        if self.record_thread:
+            self.record_thread.join(timeout)
+        return self.engine._wait_idle(self, timeout)
+
+    def stats(self):
+        return {
+            "language": self.language,
+            "latency_seconds": self.latency.summary(),
+            "lag_seconds": self.lag_seconds,
+            "dropped_samples": self.dropped_samples,
+            "pending_chunks": len(self._ready) + self._in_flight,
+        }
+
+    def _on_audio(self, samples):
+        # Incoming audio counts as use, so long replays are never expired mid-file
+        self.last_active = time.monotonic()
+        self.ring.write(samples)
+        end = self.ring.total_written
+        if end - self._chunk_start >= self.engine.chunk_samples:
+            self.engine._submit(self, self._chunk_start, end)
+            self._chunk_start = end
+
+    def _record_audio(self):
+        try:
+            self.source.start(self._on_audio)
+        except Exception as e:
+            print(f"[{self.session_id}] Error opening audio stream: {e}")
+            self.running = False
+            return
+
+        while self.running and not self.source.finished:
+            time.sleep(0.05)
+
+        self.source.stop()
+        # Hand over the tail so the last words are not lost
+        end = self.ring.total_written
+        if end > self._chunk_start:
+            self.engine._submit(self, self._chunk_start, end)
+            self._chunk_start = end
+        self.running = False
+
+    def _view(self, start, end):
+        oldest = self.ring.oldest
+        if start < oldest:
+            self.dropped_samples += oldest - start
+            metrics.inc("stt_dropped_samples_total", oldest - start, reason="overrun")
+            start = oldest
+        return self.ring.view(start, end)
+
+
+class STTEngine:
+    def __init__(self, model_size="small", device=None, compute_type="int8", chunk_seconds=5.0,
+                 batch_size=8, max_batch_wait=0.1, beam_size=5, no_speech_threshold=0.6,
+                 buffer_seconds=120.0, max_lag_seconds=10.0, idle_seconds=600.0):
+        """
+        Loads one WhisperModel and transcribes the chunks of all sessions with it.
+
+        Each session cuts its audio into `chunk_seconds` chunks. A scheduler thread
+        collects ready chunks round-robin across sessions (one per session per turn,
+        so a busy session cannot starve the others), waiting up to `max_batch_wait`
+        seconds to fill a batch of `batch_size`, and decodes the batch with a single
+        encoder and decoder call; each item is decoded in its session's language.
+        Silent chunks (VAD) are skipped before batching. Chunks that end more than
+        `max_lag_seconds` behind their session's live audio are skipped, so a slow
+        decoder never falls behind far enough for the ring buffer to overrun.
+
+        Sessions that have neither received audio nor been touched (see
+        STTSession.touch) for `idle_seconds`, and have no chunks left to decode, are
+        closed, so abandoned browser sessions do not keep their buffers; None
+        disables this.
+        """
+        if chunk_seconds > MAX_CHUNK_SECONDS:
+            raise ValueError(f"chunk_seconds must be at most {MAX_CHUNK_SECONDS}")
+        if max_lag_seconds >= buffer_seconds:
+            raise ValueError("max_lag_seconds must be smaller than buffer_seconds")
+        self.model, self.device, self.compute_type = load_whisper_model(
+            model_size, device or default_device(), compute_type)
+        print("Model loaded.")
+        self.chunk_samples = int(chunk_seconds * SAMPLE_RATE)
+        self.batch_size = batch_size
+        self.max_batch_wait = max_batch_wait
+        self.beam_size = beam_size
+        self.no_speech_threshold = no_speech_threshold
+        self.buffer_seconds = buffer_seconds
+        self.max_lag_samples = int(max_lag_seconds * SAMPLE_RATE)
+        self.vad_options = VadOptions()
+        self.idle_seconds = idle_seconds
+
+        self._sessions = {}
+        self._order = deque()  # round-robin order of session ids
+        self._tokenizers = {}
+        self._pending = 0  # ready chunks across all sessions
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def create_session(self, session_id=None, source=None, language="zh"):
+        session_id = session_id or uuid.uuid4().hex
+        session = STTSession(self, session_id, source=source, language=language,
+                             buffer_seconds=self.buffer_seconds)
+        with self._cond:
+            self._sessions[session_id] = session
+            self._order.append(session_id)
+        metrics.set_gauge("stt_sessions", len(self._sessions))
+        return session
+
+    def close_session(self, session_id):
+        """Stops the session's recording and forgets it."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return
+        if session.running:
+            session.stop_recording()
+        self._remove(session)
+
+    def _remove(self, session):
+        with self._cond:
+            if self._sessions.pop(session.session_id, None) is None:
+                return
+            self._order.remove(session.session_id)
+            self._pending -= len(session._ready)
+            session._ready.clear()
+            self._cond.notify_all()
+        metrics.set_gauge("stt_sessions", len(self._sessions))
+
+    def _expire_idle(self):
+        if self.idle_seconds is None:
+            return
+        now = time.monotonic()
+        with self._cond:
+            expired = [
+                s for s in self._sessions.values()
+                if now - s.last_active > self.idle_seconds and not s._ready and not s._in_flight
+            ]
+        for session in expired:
+            print(f"[{session.session_id}] Closing idle STT session")
+            # Not stop_recording(): that waits for this scheduler thread. The record
+            # thread stops the source on its own.
+            session.running = False
+            self._remove(session)
+            metrics.inc("stt_sessions_expired_total")
+
+    def session(self, session_id):
+        return self._sessions.get(session_id)
+
+    def stats(self):
+        return {session_id: session.stats() for session_id, session in list(self._sessions.items())}
+
+    def shutdown(self):
+        for session_id in list(self._sessions):
+            self.close_session(session_id)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _submit(self, session, start, end):
+        with self._cond:
+            if session.session_id not in self._sessions:
+                return  # closed while its tail was being handed over
+            session._ready.append((start, end, time.monotonic()))
+            self._pending += 1
+            self._cond.notify_all()
+
+    def _wait_idle(self, session, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(lambda: not session._ready and not session._in_flight, timeout)
+
+    def _next_batch(self):
+        """
+        Waits for ready chunks and takes up to `batch_size` of them round-robin.
+        Returns [(session, start, end, captured_at), ...] (empty when nothing arrived
+        within a minute, so idle sessions still get expired) or None on shutdown.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or self._pending > 0, timeout=60)
+            if self._closed:
+                return None
+            # Give other sessions a moment to contribute to the batch
+            deadline = time.monotonic() + self.max_batch_wait
+            while self._pending < self.batch_size and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = []
+            while len(batch) < self.batch_size and self._pending > 0:
+                session = self._sessions[self._order[0]]
+                self._order.rotate(-1)
+                if session._ready:
+                    start, end, captured_at = session._ready.popleft()
+                    self._pending -= 1
+                    if session.ring.total_written - end > self.max_lag_samples:
+                        # Too far behind live: skip it rather than delay everything after it
+                        session.dropped_samples += end - start
+                        metrics.inc("stt_dropped_samples_total", end - start, reason="lag")
+                        continue
+                    session._in_flight += 1
+                    batch.append((session, start, end, captured_at))
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._expire_idle()
+            try:
+                if batch:
+                    self._decode_batch(batch)
+            except Exception as e:
+                print(f"Error during batched transcription: {e}")
+            finally:
+                with self._cond:
+                    for session, _, _, _ in batch:
+                        session._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _tokenizer(self, language):
+        if language not in self._tokenizers:
+            self._tokenizers[language] = Tokenizer(
+                self.model.hf_tokenizer, self.model.model.is_multilingual, task="transcribe", language=language)
+        return self._tokenizers[language]
+
+    def _decode_batch(self, batch):
+        items = []
+        for session, start, end, captured_at in batch:
+            audio = session._view(start, end)
+            speech = get_speech_timestamps(audio, self.vad_options)
+            session.lag_seconds = (session.ring.total_written - end) / SAMPLE_RATE
+            if speech:
+                # Decode only the span that contains speech
+                items.append((session, audio[speech[0]["start"]:speech[-1]["end"]], captured_at))
+        metrics.observe("stt_batch_size", len(items))
+        if not items:
+            return
+
+        started = time.perf_counter()
+        features = np.stack([
+            pad_or_trim(self.model.feature_extractor(audio)[..., :-1]) for _, audio, _ in items
+        ])
+        encoder_output = self.model.encode(features)
+        tokenizers = [self._tokenizer(session.language) for session, _, _ in items]
+        prompts = [self.model.get_prompt(tokenizer, [], without_timestamps=True) for tokenizer in tokenizers]
+        results = self.model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=self.beam_size,
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+            return_no_speech_prob=True,
+        )
+        elapsed = time.perf_counter() - started
+        audio_seconds = sum(len(audio) for _, audio, _ in items) / SAMPLE_RATE
+        metrics.observe("stt_decode_seconds", elapsed, level="batched")
+        metrics.observe("stt_rtf", elapsed / max(audio_seconds, 1e-3))
+
+        now = time.monotonic()
+        for (session, _, captured_at), tokenizer, result in zip(items, tokenizers, results):
+            if result.no_speech_prob > self.no_speech_threshold:
+                continue
+            text = tokenizer.decode(result.sequences_ids[0]).strip()
+            if text:
+                session.transcript_queue.put(text)
+                session.latency.observe(now - captured_at)
+                metrics.observe("stt_session_latency_seconds", now - captured_at)
+
+
+def transcribe_files(engine, paths, language="zh", realtime=True):
+    """
+    Headless helper: replays each WAV file as its own concurrent session and
+    returns {path: {"texts": [...], "stats": {...}}} once all are transcribed.
+    """
+    sessions = {}
+    for path in paths:
+        session = engine.create_session(source=WavFileSource(path, realtime=realtime), language=language)
+        session.start_recording()
+        sessions[path] = session
+
+    results = {}
+    for path, session in sessions.items():
+        session.wait()
+        texts = []
+        while not session.transcript_queue.empty():
+            texts.append(session.transcript_queue.get())
+        results[path] = {"texts": texts, "stats": session.stats()}
+        engine.close_session(session.session_id)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe WAV files as concurrent live sessions.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--compute-type", default="int8")
+    parser.add_argument("--language", default="zh")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--chunk-seconds", type=float, default=5.0)
+    parser.add_argument("--no-realtime", action="store_true", help="Feed audio as fast as possible")
+    args = parser.parse_args()
+
+    engine = STTEngine(args.model, device=args.device, compute_type=args.compute_type,
+                       chunk_seconds=args.chunk_seconds, batch_size=args.batch_size)
+    results = transcribe_files(engine, args.files, language=args.language, realtime=not args.no_realtime)
+    engine.shutdown()
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
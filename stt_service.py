@@ -1,47 +1,148 @@
+import os
 import threading
 import queue
 import time
 import numpy as np
-import pyaudio
-from faster_whisper import WhisperModel
-import torch
+import ctranslate2
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+from audio_source import AudioRingBuffer, MicrophoneSource, SAMPLE_RATE
+from metrics import metrics
+
+RECORD_SECONDS = 5  # Process every 5 seconds as per spec (3-5s)
+# Converted CTranslate2 Whisper models are downloaded here once and loaded from disk afterwards
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "./model_cache")
+
+
+def default_device():
+    # Asking CTranslate2 avoids importing torch (seconds of startup) just for this
+    return "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+
+
+def load_whisper_model(model_size, device, compute_type, download_root=MODEL_CACHE_DIR):
+    """
+    Loads a WhisperModel, falling back to CPU/int8 if the device fails.
+    Returns (model, device, compute_type) as actually used.
+    """
+    print(f"Loading Whisper model: {model_size} on {device} with {compute_type}...")
+    try:
+        model = WhisperModel(model_size, device=device, compute_type=compute_type, download_root=download_root)
+        return model, device, compute_type
+    except Exception as e:
+        print(f"Error loading model on {device}: {e}")
+        print("Falling back to CPU...")
+        return WhisperModel(model_size, device="cpu", compute_type="int8", download_root=download_root), "cpu", "int8"
+
+class DegradationPolicy:
+    def __init__(self, max_lag_seconds=10.0, beam_sizes=(5, 2, 1), fallback_model_size="base",
+                 rtf_high=0.9, rtf_low=0.5, cooldown_seconds=10.0, merge_queued=True, ema_alpha=0.3):
+        """
+        Controls how STTService keeps up with live audio.
+
+        Quality levels are tried in order: the main model with each beam size in
+        `beam_sizes`, then `fallback_model_size` (loaded up front and kept warm; None
+        disables it) with the smallest beam. The service steps down a level when the
+        smoothed real-time factor (decode time / audio time) exceeds `rtf_high` or the
+        backlog exceeds half of `max_lag_seconds`, and steps back up when the RTF falls
+        below `rtf_low` with no backlog. Level changes are at least `cooldown_seconds`
+        apart. Audio older than `max_lag_seconds` behind live is skipped, so the
+        transcript never lags further than that. With `merge_queued`, chunks that piled
+        up are decoded together in one batched call.
+        """
+        self.max_lag_seconds = max_lag_seconds
+        self.beam_sizes = tuple(beam_sizes)
+        self.fallback_model_size = fallback_model_size
+        self.rtf_high = rtf_high
+        self.rtf_low = rtf_low
+        self.cooldown_seconds = cooldown_seconds
+        self.merge_queued = merge_queued
+        self.ema_alpha = ema_alpha
+
 
 class STTService:
     # Changed default model from "base" to "small" for better accuracy
     # Options: "tiny", "base", "small", "medium", "large-v2"
-    def __init__(self, model_size="small", device=None, compute_type="int8", language="zh"):
-        if device is None:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        else:
-            self.device = device
-            
+    def __init__(self, model_size="small", device=None, compute_type="int8", language="zh",
+                 streaming=False, step_seconds=0.5, window_seconds=15.0, commit_margin=1.0,
+                 silence_seconds=0.6, source=None, buffer_seconds=120.0, policy=None):
+        """
+        streaming=False keeps the original behaviour: fixed 5-second chunks, each
+        transcribed independently.
+
+        streaming=True decodes a rolling buffer every `step_seconds`. Provisional text
+        is exposed through `partial_text`; only segments that are stable (confirmed by
+        two consecutive decodes and ending at least `commit_margin` seconds before the
+        end of the buffer, or followed by `silence_seconds` of VAD silence) are put on
+        `transcript_queue`. The buffer is then trimmed at the committed segment end, so
+        no audio is decoded into committed text twice. `window_seconds` caps the buffer.
+
+        `source` is an AudioSource (default: the microphone). Captured audio is written
+        into a preallocated ring buffer of `buffer_seconds`; `audio_queue` carries
+        (start, end) sample positions and the transcriber decodes zero-copy views.
+
+        `policy` is a DegradationPolicy (default: DegradationPolicy()) that bounds how
+        far transcription may fall behind live audio.
+        """
+        self.device = device or default_device()
+
         self.compute_type = compute_type
         self.language = language
-        print(f"Loading Whisper model: {model_size} on {self.device} with {compute_type}...")
-        try:
-            self.model = WhisperModel(model_size, device=self.device, compute_type=self.compute_type)
-        except Exception as e:
-            print(f"Error loading model on {self.device}: {e}")
-            print("Falling back to CPU...")
-            self.device = "cpu"
-            self.compute_type = "int8"
-            self.model = WhisperModel(model_size, device=self.device, compute_type=self.compute_type)
-            
+        self.model = self._load_model(model_size)
         print("Model loaded.")
+
+        self.policy = policy or DegradationPolicy()
+        if window_seconds >= buffer_seconds or self.policy.max_lag_seconds >= buffer_seconds:
+            raise ValueError("window_seconds and max_lag_seconds must be smaller than buffer_seconds")
+        # Quality ladder: [(model, beam_size), ...] from best to cheapest
+        self.levels = [(self.model, beam) for beam in self.policy.beam_sizes]
+        if self.policy.fallback_model_size and self.policy.fallback_model_size != model_size:
+            fallback = self._load_model(self.policy.fallback_model_size)
+            self.levels.append((fallback, min(self.policy.beam_sizes)))
+        self.level = 0
+        self._level_changed_at = 0.0
+        # Smoothed decode time / audio time of recent decodes
+        self.rtf = 0.0
+        # Seconds of captured audio not yet transcribed
+        self.lag_seconds = 0.0
+        self.streaming = streaming
+        self.step_seconds = step_seconds
+        self.window_seconds = window_seconds
+        self.commit_margin = commit_margin
+        self.silence_seconds = silence_seconds
+        self.vad_options = VadOptions(min_silence_duration_ms=int(silence_seconds * 1000))
+
+        self.source = source
+        self.ring = AudioRingBuffer(int(buffer_seconds * SAMPLE_RATE))
+        self._chunk_start = 0
+        self._chunk_samples = int((step_seconds if streaming else RECORD_SECONDS) * SAMPLE_RATE)
+        # Samples lost because the transcriber fell more than buffer_seconds behind
+        self.dropped_samples = 0
+
         self.running = False
         self.audio_queue = queue.Queue()
         self.transcript_queue = queue.Queue()
+        # Latest provisional (uncommitted) hypothesis in streaming mode
+        self.partial_text = ""
         self.record_thread = None
         self.transcribe_thread = None
 
+    def _load_model(self, model_size):
+        model, self.device, self.compute_type = load_whisper_model(model_size, self.device, self.compute_type)
+        return model
+
     def set_language(self, language):
         self.language = language
         print(f"Language set to: {self.language}")
 
     def start_recording(self):
+        if self.source is None:
+            self.source = MicrophoneSource()
         self.running = True
+        self.partial_text = ""
+        self._chunk_start = self.ring.total_written
         self.record_thread = threading.Thread(target=self._record_audio)
-        self.transcribe_thread = threading.Thread(target=self._transcribe_audio)
+        target = self._stream_audio if self.streaming else self._transcribe_audio
+        self.transcribe_thread = threading.Thread(target=target)
         self.record_thread.start()
         self.transcribe_thread.start()
         print("STT Service started.")
@@ -49,76 +150,274 @@ class STTService:
     def stop_recording(self):
         print("Stopping STT Service...")
         self.running = False
+        self.wait()
+        print("STT Service stopped.")
+
+    def wait(self):
+        """
+        Blocks until capture and transcription have finished, e.g. after a file
+        source has been fully replayed.
+        """
         if self.record_thread:
             self.record_thread.join()
         if self.transcribe_thread:
             self.transcribe_thread.join()
-        print("STT Service stopped.")
 
-    def _record_audio(self):
-        CHUNK = 1024
-        FORMAT = pyaudio.paInt16
-        CHANNELS = 1
-        RATE = 16000
-        RECORD_SECONDS = 5  # Process every 5 seconds as per spec (3-5s)
+    def _on_audio(self, samples):
+        # Runs on the audio callback thread: write into the ring and publish positions
+        with metrics.time("stt_capture_seconds"):
+            self.ring.write(samples)
+            end = self.ring.total_written
+            if end - self._chunk_start >= self._chunk_samples:
+                self.audio_queue.put((self._chunk_start, end))
+                self._chunk_start = end
+        metrics.set_gauge("stt_audio_queue_depth", self.audio_queue.qsize())
 
-        p = pyaudio.PyAudio()
+    def _record_audio(self):
         try:
-            stream = p.open(format=FORMAT,
-                            channels=CHANNELS,
-                            rate=RATE,
-                            input=True,
-                            frames_per_buffer=CHUNK)
+            self.source.start(self._on_audio)
         except Exception as e:
             print(f"Error opening audio stream: {e}")
             self.running = False
             return
 
         print("Recording thread active...")
-        
-        frames = []
-        start_time = time.time()
+        while self.running and not self.source.finished:
+            time.sleep(0.05)
 
-        while self.running:
-            try:
-                data = stream.read(CHUNK, exception_on_overflow=False)
-                frames.append(data)
-                
-                if time.time() - start_time > RECORD_SECONDS:
-                    audio_data = b''.join(frames)
-                    self.audio_queue.put(audio_data)
-                    frames = []
-                    start_time = time.time()
-            except Exception as e:
-                print(f"Error recording: {e}")
-                break
+        self.source.stop()
+        # Hand over the tail so the last words are not lost
+        end = self.ring.total_written
+        if end > self._chunk_start:
+            self.audio_queue.put((self._chunk_start, end))
+            self._chunk_start = end
+        # A finite source (file/replay) ending finishes the session
+        self.running = False
+
+    def _capturing(self):
+        return self.running or (self.record_thread is not None and self.record_thread.is_alive())
 
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+    def _view(self, start, end):
+        """
+        Zero-copy view of [start, end), skipping audio that was already overwritten.
+        """
+        oldest = self.ring.oldest
+        if start < oldest:
+            self.dropped_samples += oldest - start
+            metrics.inc("stt_dropped_samples_total", oldest - start, reason="overrun")
+            print(f"Warning: transcriber fell behind, dropped {(oldest - start) / SAMPLE_RATE:.1f}s of audio")
+            start = oldest
+        return self.ring.view(start, end), start
 
     def _transcribe_audio(self):
         print("Transcription thread active...")
-        while self.running or not self.audio_queue.empty():
+        while self._capturing() or not self.audio_queue.empty():
             try:
-                audio_data = self.audio_queue.get(timeout=1)
+                start, end = self.audio_queue.get(timeout=1)
             except queue.Empty:
                 continue
 
-            # Convert raw bytes to numpy array (float32)
-            # 16-bit PCM is signed integer, so we divide by 32768
-            audio_np = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
+            # Chunks that piled up during a slow decode are contiguous in the ring,
+            # so they can be decoded as one longer window
+            merged = 1
+            while self.policy.merge_queued:
+                try:
+                    _, end = self.audio_queue.get_nowait()
+                    merged += 1
+                except queue.Empty:
+                    break
+
+            # Audio captured since this window closed = how long it waited in the queue
+            metrics.observe("stt_queue_wait_seconds", (self.ring.total_written - end) / SAMPLE_RATE)
+            start = self._skip_backlog(start, end)
+            audio_np, start = self._view(start, end)
 
             try:
                 # vad_filter=True helps avoid hallucinations on silence
-                segments, info = self.model.transcribe(audio_np, beam_size=5, vad_filter=True, language=self.language)
+                segments, info = self._transcribe(audio_np, batched=merged > 1)
 
                 text_segment = ""
                 for segment in segments:
                     text_segment += segment.text + " "
-                
+
                 if text_segment.strip():
                     print(f"Detected: {text_segment}")
                     self.transcript_queue.put(text_segment.strip())
             except Exception as e:
                 print(f"Error during transcription: {e}")
+            self._adapt(end)
+
+    def _stream_audio(self):
+        """
+        Streaming transcription loop over a rolling buffer (see __init__). The rolling
+        buffer is a view of the ring from `buffer_start` to the newest sample, so
+        trimming is just advancing `buffer_start`.
+        """
+        print("Streaming transcription thread active...")
+        buffer_start = processed_end = self.ring.total_written
+        previous = []  # [(end, text)] of the previous decode, relative to buffer start
+
+        while self._capturing() or not self.audio_queue.empty():
+            try:
+                _, end = self.audio_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            # Catch up on everything captured while the last decode was running
+            while True:
+                try:
+                    _, end = self.audio_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            final = not self._capturing() and self.audio_queue.empty()
+            # Audio captured since this window closed = how long it waited in the queue
+            metrics.observe("stt_queue_wait_seconds", (self.ring.total_written - end) / SAMPLE_RATE)
+            # Only audio no decode has seen yet counts as backlog; the uncommitted part
+            # of the rolling window is expected to be re-decoded
+            skipped = self._skip_backlog(max(buffer_start, processed_end), end)
+            if skipped > max(buffer_start, processed_end):
+                buffer_start, previous = skipped, []
+            processed_end = end
+            buffer, buffer_start = self._view(buffer_start, end)
+            try:
+                commit_end, previous = self._decode_window(buffer, previous, final)
+            except Exception as e:
+                print(f"Error during transcription: {e}")
+                continue
+
+            if commit_end > 0:
+                buffer_start += int(commit_end * SAMPLE_RATE)
+                previous = [(t_end - commit_end, text) for t_end, text in previous]
+            self._adapt(end)
+
+        # Recording ended while the last decode was provisional: commit the remainder
+        end = self.ring.total_written
+        if end > buffer_start:
+            buffer, buffer_start = self._view(buffer_start, end)
+            try:
+                self._decode_window(buffer, previous, final=True)
+            except Exception as e:
+                print(f"Error during transcription: {e}")
+        self.partial_text = ""
+
+    def _decode_window(self, buffer, previous, final=False):
+        """
+        Decodes the rolling buffer once, commits stable segments and updates
+        `partial_text`. Returns (commit_end_seconds, hypothesis) where hypothesis is
+        the uncommitted remainder used for agreement on the next pass.
+        """
+        duration = len(buffer) / SAMPLE_RATE
+        if duration == 0:
+            return 0.0, previous
+
+        # No speech at all: drop the audio, keep only a short tail for onset context
+        speech = get_speech_timestamps(buffer, self.vad_options)
+        if not speech:
+            self.partial_text = ""
+            return max(0.0, duration - self.commit_margin), []
+
+        segments, info = self._transcribe(buffer, condition_on_previous_text=False)
+        hypothesis = [(s.end, s.text.strip()) for s in segments if s.text.strip()]
+        if not hypothesis:
+            self.partial_text = ""
+            # Speech VAD could not turn into text; don't let it hold the window forever
+            if duration >= self.window_seconds:
+                return max(0.0, duration - self.commit_margin), []
+            return 0.0, []
+
+        # Speech has ended if VAD saw enough trailing silence: everything is stable
+        last_speech_end = speech[-1]["end"] / SAMPLE_RATE
+        speech_ended = duration - last_speech_end >= self.silence_seconds
+
+        if final or speech_ended:
+            n_commit = len(hypothesis)
+        else:
+            # A segment is stable if the previous pass produced the same text for it and
+            # it ends clear of the growing edge of the buffer. The last segment is never
+            # committed while speech continues, since its words may still change.
+            n_commit = 0
+            for i, (end, text) in enumerate(hypothesis[:-1]):
+                agreed = i < len(previous) and previous[i][1] == text
+                if not agreed or end > duration - self.commit_margin:
+                    break
+                n_commit = i + 1
+            # Window full: force out everything but the tail segment
+            if n_commit == 0 and duration >= self.window_seconds:
+                n_commit = max(1, len(hypothesis) - 1)
+
+        committed = hypothesis[:n_commit]
+        pending = hypothesis[n_commit:]
+        if committed:
+            text = " ".join(t for _, t in committed)
+            print(f"Detected: {text}")
+            self.transcript_queue.put(text)
+        self.partial_text = " ".join(t for _, t in pending)
+
+        if not committed:
+            return 0.0, hypothesis
+        commit_end = committed[-1][0]
+        if n_commit == len(hypothesis) and (final or speech_ended):
+            # Everything emitted; cut at the end of speech so trailing silence is dropped
+            commit_end = max(commit_end, last_speech_end)
+        return min(commit_end, duration), pending
+
+    def _transcribe(self, audio, batched=False, **kwargs):
+        """
+        Decodes `audio` at the current quality level and updates the smoothed RTF.
+        Segments are materialised here so the timing covers the whole decode.
+        """
+        model, beam_size = self.levels[self.level]
+        started = time.perf_counter()
+        if batched:
+            segments, info = BatchedInferencePipeline(model=model).transcribe(
+                audio, beam_size=beam_size, vad_filter=True, language=self.language, **kwargs)
+        else:
+            segments, info = model.transcribe(
+                audio, beam_size=beam_size, vad_filter=True, language=self.language, **kwargs)
+        segments = list(segments)
+        elapsed = time.perf_counter() - started
+        rtf = elapsed / max(len(audio) / SAMPLE_RATE, 1e-3)
+        metrics.observe("stt_decode_seconds", elapsed, level=self.level)
+        metrics.observe("stt_rtf", rtf)
+        alpha = self.policy.ema_alpha
+        self.rtf = rtf if self.rtf == 0.0 else alpha * rtf + (1 - alpha) * self.rtf
+        return segments, info
+
+    def _skip_backlog(self, start, end):
+        """
+        Enforces the policy's maximum lag: returns a start position no more than
+        max_lag_seconds behind `end`, counting any skipped audio as dropped.
+        """
+        limit = end - int(self.policy.max_lag_seconds * SAMPLE_RATE)
+        if start >= limit:
+            return start
+        self.dropped_samples += limit - start
+        metrics.inc("stt_dropped_samples_total", limit - start, reason="max_lag")
+        print(f"Warning: {(limit - start) / SAMPLE_RATE:.1f}s behind live, skipping backlog")
+        return limit
+
+    def _adapt(self, processed_end):
+        """
+        Steps the quality level down or up according to the policy.
+        """
+        self.lag_seconds = (self.ring.total_written - processed_end) / SAMPLE_RATE
+        metrics.set_gauge("stt_lag_seconds", self.lag_seconds)
+        metrics.set_gauge("stt_quality_level", self.level)
+        now = time.monotonic()
+        if now - self._level_changed_at < self.policy.cooldown_seconds:
+            return
+
+        overloaded = self.rtf > self.policy.rtf_high or self.lag_seconds > self.policy.max_lag_seconds / 2
+        relaxed = self.rtf < self.policy.rtf_low and self.lag_seconds < 2 * self._chunk_samples / SAMPLE_RATE
+        if overloaded and self.level < len(self.levels) - 1:
+            self.level += 1
+        elif relaxed and self.level > 0:
+            self.level -= 1
+        else:
+            return
+        _, beam_size = self.levels[self.level]
+        print(f"Transcription level {self.level} (beam_size={beam_size}), "
+              f"RTF {self.rtf:.2f}, lag {self.lag_seconds:.1f}s")
+        self._level_changed_at = now
+        # The RTF was measured at the old level
+        self.rtf = 0.0
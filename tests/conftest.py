@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the flat modules from the repo root: `python -m pytest tests`
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+@pytest.fixture
+def make_rag_service(tmp_path):
+    """Builds RAGServices on a local Qdrant store under tmp_path with the model-free hash embeddings."""
+    from rag_service import RAGService
+
+    services = []
+
+    def make(**kwargs):
+        kwargs.setdefault("path", str(tmp_path / "qdrant"))
+        kwargs.setdefault("embedding_cache_path", str(tmp_path / "embeddings.sqlite"))
+        service = RAGService(embedding_backend="hash", **kwargs)
+        services.append(service)
+        return service
+
+    yield make
+    for service in services:
+        service.ingest_queue.close()
+        service.client.close()
+
+
+@pytest.fixture
+def rag_service(make_rag_service):
+    return make_rag_service()
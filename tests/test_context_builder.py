@@ -0,0 +1,45 @@
+import numpy as np
+
+from context_builder import ContextBuilder
+from text_utils import estimate_tokens
+
+TOPICS = ["alpha report", "bravo schedule", "charlie hiring", "delta office", "echo travel",
+          "the zebra budget", "foxtrot lunch", "golf parking", "hotel security", "india roadmap"]
+
+
+def test_mmr_prefers_a_diverse_second_pick():
+    builder = ContextBuilder(rag_service=None, mmr_lambda=0.7)
+    vectors = np.array([
+        [0.9, 0.436, 0.0],   # a
+        [0.9, 0.43, 0.05],   # near copy of a, slightly more relevant
+        [0.9, -0.436, 0.0],  # as relevant, different direction
+    ])
+    assert builder.mmr(np.array([1.0, 0.0, 0.0]), vectors) == [1, 2, 0]
+
+
+def test_hit_brings_its_neighbors_in_spoken_order(make_rag_service):
+    rag_service = make_rag_service(dedup=False)
+    rag_service.batch_add_transcripts(TOPICS, meeting_id="m")
+    builder = ContextBuilder(rag_service, candidates=1, neighbor_radius=1)
+    assert builder.build("zebra budget", meeting_id="m") == (
+        "[Meeting m]\necho travel\nthe zebra budget\nfoxtrot lunch"
+    )
+
+
+def test_token_budget_keeps_the_hit_and_drops_neighbors_that_do_not_fit(make_rag_service):
+    rag_service = make_rag_service(dedup=False)
+    rag_service.batch_add_transcripts(TOPICS, meeting_id="m")
+    budget = estimate_tokens("the zebra budget") + 1 + estimate_tokens("echo travel") + 1
+    builder = ContextBuilder(rag_service, token_budget=budget, candidates=1, neighbor_radius=2)
+    lines = builder.build("zebra budget").splitlines()
+    assert "the zebra budget" in lines
+    assert sum(estimate_tokens(line) + 1 for line in lines[1:]) <= budget
+
+
+def test_segments_without_a_meeting_do_not_collide(make_rag_service):
+    rag_service = make_rag_service(dedup=False)
+    # Separate ingests without meeting_id: both get seq 0
+    rag_service.batch_add_transcripts(["zebra budget approved"])
+    rag_service.batch_add_transcripts(["zebra budget postponed"])
+    context = ContextBuilder(rag_service, candidates=2).build("zebra budget")
+    assert sorted(context.splitlines()) == ["zebra budget approved", "zebra budget postponed"]
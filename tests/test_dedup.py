@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from dedup import DuplicateFilter, collapse_repeats
+
+
+@pytest.mark.parametrize("text", [
+    "1,000,000,000",
+    "2020-20-20-20",
+    "100100100",
+    "call 555 555 555 5555",
+    "version 1.1.1.1",
+    "lalala land",
+    "www.w.w.w",
+    "我们我们我们讨论一下",
+    "thank you",
+])
+def test_collapse_repeats_leaves_numbers_and_words_alone(text):
+    assert collapse_repeats(text) == text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("very very very good", "very good"),
+    ("ok, ok, ok, ok", "ok"),
+    ("thank you thank you thank you", "thank you"),
+    ("好的好的好的好的", "好的"),
+    ("好的，好的，好的。然后呢", "好的。然后呢"),
+])
+def test_collapse_repeats_collapses_looped_phrases(text, expected):
+    assert collapse_repeats(text) == expected
+
+
+def test_hallucination_blocklist_matches_only_whole_texts():
+    f = DuplicateFilter()
+    assert f.is_hallucination("Thanks for watching!")
+    assert f.is_hallucination("谢谢观看。Please subscribe")
+    assert not f.is_hallucination("Thanks for watching the demo, now the budget")
+
+
+def test_duplicate_filter_is_scoped():
+    f = DuplicateFilter(threshold=0.95)
+    v = np.array([[1.0, 0.0], [0.0, 1.0]])
+    assert f.filter(["a", "b"], v, ["m1", "m1"]) == [None, None]
+    # Same vectors: duplicates within m1, new in m2; re-adding an id is not a duplicate of itself
+    assert f.filter(["c", "d", "a"], np.vstack([v, v[:1]]), ["m1", "m2", "m1"]) == ["a", None, None]
+
+
+def test_store_keeps_raw_text_and_scopes_batches_without_meeting(rag_service):
+    rag_service.batch_add_transcripts(["the budget is approved approved approved"])
+    # No meeting_id: an identical line from another ingest is stored, one within the batch is not
+    rag_service.batch_add_transcripts(["the budget is approved approved approved"])
+    rag_service.batch_add_transcripts(["lunch order", "lunch order"])
+    rag_service.batch_add_transcripts(["Thank you for watching."])
+
+    payloads = [p.payload for page in rag_service.iter_points(with_vectors=False) for p in page]
+    assert sorted(p["text"] for p in payloads) == [
+        "lunch order", "the budget is approved", "the budget is approved",
+    ]
+    assert {p.get("raw_text") for p in payloads if p["text"] != "lunch order"} == {
+        "the budget is approved approved approved",
+    }
+
+
+def test_same_meeting_repeats_are_dropped_across_batches(rag_service):
+    rag_service.batch_add_transcripts(["we approve the marketing budget"], meeting_id="m")
+    rag_service.batch_add_transcripts(["We approve the marketing budget."], meeting_id="m")
+    rag_service.batch_add_transcripts(["we approve the marketing budget"], meeting_id="other")
+    assert rag_service.count() == 2
+
+
+def test_merge_mode_folds_repeats_into_the_earlier_point(make_rag_service):
+    rag_service = make_rag_service(dedup_mode="merge")
+    rag_service.batch_add_transcripts(["we approve the marketing budget"], meeting_id="m",
+                                      payloads=[{"audio_start": 0.0, "audio_end": 2.0}])
+    rag_service.batch_add_transcripts(["we approve the marketing budget", "next item"], meeting_id="m",
+                                      payloads=[{"audio_start": 2.0, "audio_end": 4.0},
+                                                {"audio_start": 4.0, "audio_end": 5.0}])
+    payloads = {p.payload["text"]: p.payload for page in rag_service.iter_points(with_vectors=False) for p in page}
+    assert sorted(payloads) == ["next item", "we approve the marketing budget"]
+    merged = payloads["we approve the marketing budget"]
+    assert merged["repeat_count"] == 2
+    assert merged["audio_end"] == 4.0
@@ -0,0 +1,63 @@
+import json
+import threading
+
+from ingest_queue import IngestQueue
+
+
+class RecordingWriter:
+    """write_batch stand-in that stores texts and rejects any batch containing a poison text."""
+
+    def __init__(self, poison=()):
+        self.poison = set(poison)
+        self.stored = []
+        self.calls = 0
+
+    def __call__(self, texts, payloads, ids):
+        self.calls += 1
+        if self.poison & set(texts):
+            raise ValueError("payload rejected")
+        self.stored.extend(texts)
+
+
+def test_poison_batch_is_dead_lettered_and_does_not_block(tmp_path):
+    writer = RecordingWriter(poison={"poison"})
+    spool = str(tmp_path / "spool.jsonl")
+    q = IngestQueue(writer, spool_path=spool, max_attempts=2, retry_delay=0.01, max_latency=0.2)
+
+    # One batch: the good items around the poison one must still be stored
+    q.put(["first", "poison", "second"])
+    assert q.flush(timeout=5)
+    q.put(["after"])
+    assert q.flush(timeout=5)
+    q.close(timeout=5)
+
+    assert sorted(writer.stored) == ["after", "first", "second"]
+    with open(spool + ".dead.jsonl", encoding="utf-8") as f:
+        dead = [json.loads(line) for line in f]
+    assert [record["item"]["text"] for record in dead] == ["poison"]
+    assert "payload rejected" in dead[0]["error"]
+
+
+def test_pending_items_are_replayed_after_a_crash(tmp_path):
+    spool = str(tmp_path / "spool.jsonl")
+    release = threading.Event()
+
+    def stuck_writer(texts, payloads, ids):
+        # The process "crashes" before this batch is stored
+        release.wait()
+        raise RuntimeError("crashed")
+
+    crashed = IngestQueue(stuck_writer, spool_path=spool, max_latency=0.05)
+    ids = crashed.put(["one", "two"], payloads=[{"seq": 0}, {"seq": 1}])
+    assert not crashed.flush(timeout=0.2)
+
+    writer = RecordingWriter()
+    stored_ids = []
+    restarted = IngestQueue(lambda t, p, i: (writer(t, p, i), stored_ids.extend(i)), spool_path=spool,
+                            max_latency=0.05)
+    assert restarted.flush(timeout=5)
+    restarted.close(timeout=5)
+    # Same ids as the original put, so the replay overwrites instead of duplicating
+    assert writer.stored == ["one", "two"]
+    assert stored_ids == ids
+    release.set()
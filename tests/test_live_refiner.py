@@ -0,0 +1,49 @@
+import json
+import re
+
+import pytest
+
+pytest.importorskip("dotenv")  # llm_service loads .env on import
+
+from live_refiner import BackgroundRefiner
+from llm_backends import LLMBackend
+from llm_service import LLMService
+
+
+class UppercaseBackend(LLMBackend):
+    """Refines by upper-casing each 'ID n: text' line; the first `failures` calls return junk."""
+
+    name = "fake"
+
+    def __init__(self, failures=0):
+        super().__init__("fake-model")
+        self.failures = failures
+        self.calls = 0
+
+    def _generate(self, prompt):
+        self.calls += 1
+        if self.calls <= self.failures:
+            return "not json"
+        lines = re.findall(r"^\s*ID (\d+): (.*)$", prompt, flags=re.MULTILINE)
+        return json.dumps([{"id": int(i), "text": text.upper()} for i, text in lines])
+
+
+@pytest.fixture
+def make_llm_service(monkeypatch):
+    monkeypatch.setenv("LLM_CACHE", "off")
+    return lambda backend: LLMService(backend=backend)
+
+
+def test_refine_batch_returns_refined_texts_or_nothing(make_llm_service):
+    transcripts = [{"id": 0, "text": "hello"}, {"id": 1, "text": "budget"}]
+    assert make_llm_service(UppercaseBackend()).refine_batch("", transcripts) == {0: "HELLO", 1: "BUDGET"}
+    assert make_llm_service(UppercaseBackend(failures=1)).refine_batch("", transcripts, retries=0) == {}
+
+
+def test_failed_live_batch_is_retried_at_finish(make_llm_service):
+    backend = UppercaseBackend(failures=1)
+    refiner = BackgroundRefiner(make_llm_service(backend), "agenda", batch_size=2, stable_seconds=0.05,
+                                min_interval=0, retries=0)
+    for i, text in enumerate(["one", "two", "three", "four"]):
+        refiner.add(i, text)
+    assert refiner.finish(timeout=10) == {0: "ONE", 1: "TWO", 2: "THREE", 3: "FOUR"}
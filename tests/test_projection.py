@@ -0,0 +1,53 @@
+import time
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+from projection import ProjectionEngine
+
+
+def write_elsewhere(rag_service, point_id, text):
+    """Upserts through the Qdrant client directly, like another process would: no generation bump."""
+    vector = rag_service.encode_query(text)
+    rag_service.client.upsert(
+        collection_name=rag_service.collection_name,
+        points=[PointStruct(id=point_id, vector=vector.tolist(), payload={"text": text, "embedded_at": time.time()})],
+    )
+
+
+def test_refresh_picks_up_outside_writes_and_rewritten_vectors(make_rag_service, monkeypatch):
+    rag_service = make_rag_service(dedup=False)
+    rag_service.batch_add_transcripts([f"topic {i} budget planning hiring roadmap" for i in range(30)],
+                                      meeting_id="m")
+    projection = ProjectionEngine(rag_service, page_size=8)
+    projection.refresh()
+    assert len(projection) == 30
+
+    scans = []
+    iter_points = rag_service.iter_points
+    monkeypatch.setattr(rag_service, "iter_points", lambda *a, **k: scans.append(1) or iter_points(*a, **k))
+    projection.refresh()
+    assert not scans  # unchanged: count and latest write only
+
+    generation = rag_service.generation
+    new_id = "00000000-0000-0000-0000-000000000001"
+    write_elsewhere(rag_service, new_id, "lunch menu and parking")
+    assert rag_service.generation == generation
+    projection.refresh()
+    assert len(projection) == 31 and new_id in projection.ids
+
+    # Same id, new vector (e.g. an import with --reembed): projected again, not kept stale
+    point_id = projection.ids[0]
+    before = projection.coords[projection.ids.index(point_id)].copy()
+    rag_service.upsert_points([point_id], [{"text": "completely different words about travel"}])
+    projection.refresh()
+    after = projection.coords[projection.ids.index(point_id)]
+    assert len(projection) == 31
+    assert not np.allclose(before, after)
+
+    # The cache carries the fingerprint, so a restart doesn't rescan an unchanged store
+    scans.clear()
+    reloaded = ProjectionEngine(rag_service, page_size=8)
+    reloaded.refresh()
+    assert not scans
+    assert reloaded.ids == projection.ids
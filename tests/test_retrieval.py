@@ -0,0 +1,72 @@
+from lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_codes_and_splits_cjk():
+    assert tokenize("Ship PRJ-1024 in v2.5") == ["ship", "prj-1024", "prj", "1024", "in", "v2.5", "v2", "5"]
+    # CJK runs become unigrams plus bigrams
+    assert tokenize("预算会议") == ["预", "算", "会", "议", "预算", "算会", "会议"]
+
+
+def test_bm25_finds_cjk_terms_without_a_segmenter():
+    index = BM25Index()
+    index.add_many([(1, "明天讨论预算"), (2, "今天的会议很长"), (3, "预算批准了")])
+    assert {doc_id for doc_id, _ in index.search("预算")} == {1, 3}
+    assert index.search("会议")[0][0] == 2
+
+
+def test_bm25_replaces_re_added_documents():
+    index = BM25Index()
+    index.add_many([(1, "budget review"), (2, "hiring plan")])
+    index.add_many([(1, "office move")])
+    assert index.search("budget") == []
+    assert index.search("office")[0][0] == 1
+    assert len(index) == 2
+
+
+def test_bm25_field_filter_applies_before_top_k(tmp_path):
+    path = str(tmp_path / "bm25.jsonl")
+    index = BM25Index(path, fields=("meeting_id",))
+    index.add_many([(f"big-{i}", "budget budget budget", {"meeting_id": "big"}) for i in range(50)])
+    index.add_many([("small-0", "the budget", {"meeting_id": "small"}), ("small-1", "lunch", {"meeting_id": "small"})])
+    assert index.search("budget", limit=5, where={"meeting_id": "small"})[0][0] == "small-0"
+
+    # Field values survive a replay of the log; re-adding a document moves it
+    index.add_many([("small-0", "the budget", {"meeting_id": "big"})])
+    replayed = BM25Index(path, fields=("meeting_id",))
+    assert replayed.missing_fields == 0
+    assert replayed.search("budget", where={"meeting_id": "small"}) == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "e"]])
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c", "d", "e"}
+
+
+def _fill_meetings(rag_service):
+    # Near misses for the dense leg: same character bigrams, none of the query's words
+    rag_service.batch_add_transcripts([f"budgetz prk-1024x {i}" for i in range(40)], meeting_id="small")
+    rag_service.batch_add_transcripts(["PRJ-1024 zebra xylophone quartz marble harbour"], meeting_id="small")
+    # Another meeting full of exact matches that would crowd out a global top-k
+    rag_service.batch_add_transcripts([f"budgets PRJ-1024 PRJ-1024 item {i}" for i in range(300)], meeting_id="big")
+
+
+def test_filtered_hybrid_search_surfaces_lexical_hits_missed_by_dense(make_rag_service):
+    rag_service = make_rag_service(dedup=False)
+    _fill_meetings(rag_service)
+    target = "PRJ-1024 zebra xylophone quartz marble harbour"
+    query = "budgets PRJ-1024"
+
+    dense = rag_service.query(query, limit=20, mode="dense", meeting_id="small")
+    assert target not in dense
+    assert target in rag_service.query(query, limit=3, mode="hybrid", meeting_id="small")
+    assert rag_service.query(query, limit=3, mode="lexical", meeting_id="small") == [target]
+
+
+def test_unfiltered_hybrid_search_finds_exact_codes(make_rag_service):
+    rag_service = make_rag_service(dedup=False)
+    rag_service.batch_add_transcripts([f"budgetz prk-1024x {i}" for i in range(40)])
+    rag_service.batch_add_transcripts(["PRJ-1024 zebra xylophone quartz marble harbour"])
+    query = "budgets PRJ-1024"
+    assert "PRJ-1024 zebra xylophone quartz marble harbour" not in rag_service.query(query, limit=3, mode="dense")
+    assert "PRJ-1024 zebra xylophone quartz marble harbour" in rag_service.query(query, limit=3, mode="hybrid")
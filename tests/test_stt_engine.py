@@ -0,0 +1,50 @@
+import time
+import wave
+
+import numpy as np
+import pytest
+
+import stt_engine
+from audio_source import SAMPLE_RATE
+
+
+class FakeModelEngine(stt_engine.STTEngine):
+    """Engine whose 'model' transcribes every chunk as its sample range."""
+
+    def _decode_batch(self, batch):
+        for session, start, end, _ in batch:
+            session.transcript_queue.put(f"{start}-{end}")
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    monkeypatch.setattr(stt_engine, "load_whisper_model", lambda *args: (object(), "cpu", "int8"))
+    engine = FakeModelEngine(chunk_seconds=0.25, max_batch_wait=0.01, idle_seconds=0.5)
+    yield engine
+    engine.shutdown()
+
+
+def write_wav(path, seconds):
+    samples = (np.sin(np.arange(int(seconds * SAMPLE_RATE)) * 0.05) * 8000).astype(np.int16)
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+def test_realtime_replay_longer_than_idle_timeout_is_not_expired(engine, tmp_path):
+    path = tmp_path / "meeting.wav"
+    write_wav(path, 2.0)
+    idle = engine.create_session("idle")
+
+    started = time.monotonic()
+    results = stt_engine.transcribe_files(engine, [path], realtime=True)
+    assert time.monotonic() - started > 4 * engine.idle_seconds
+
+    texts = results[path]["texts"]
+    # Every chunk up to the end of the file was transcribed
+    assert len(texts) == 8
+    assert texts[-1].endswith(f"-{2 * SAMPLE_RATE}")
+    # A session that really is idle is still closed
+    assert idle.session_id not in engine.stats()
@@ -0,0 +1,23 @@
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+# Han, kana and Hangul characters are roughly one token each
+_CJK_CHAR = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+
+
+def normalize_text(text):
+    """
+    Canonical form used for hashing/caching: NFKC (folds full-width characters),
+    trimmed, with runs of whitespace collapsed to a single space.
+    """
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def estimate_tokens(text):
+    """
+    Cheap LLM token estimate without a tokenizer: one token per CJK character plus
+    one per four other characters. Good enough for budgeting prompts.
+    """
+    cjk = len(_CJK_CHAR.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
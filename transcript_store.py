@@ -0,0 +1,78 @@
+import os
+import sqlite3
+import threading
+from collections import deque
+
+
+class TranscriptStore:
+    def __init__(self, session_id, path="./transcripts.sqlite", window=200):
+        """
+        Transcript lines of one recording session. The last `window` lines are kept
+        in memory for the live view; every line is written to a SQLite table, so
+        older lines are read back page by page instead of living in session state.
+        """
+        self.session_id = session_id
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "session_id TEXT NOT NULL, id INTEGER NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, id))"
+        )
+        self._db.commit()
+        # Reopening a session id continues where it left off
+        self._count = self._db.execute(
+            "SELECT COUNT(*) FROM transcripts WHERE session_id = ?", (session_id,)).fetchone()[0]
+        self._recent.extend(self.page(max(0, self._count - window), window))
+
+    def __len__(self):
+        return self._count
+
+    def append(self, text):
+        """Stores a line and returns its row ({"id", "text", "do_save"})."""
+        with self._lock:
+            row = {"id": self._count, "text": text, "do_save": True}
+            self._db.execute("INSERT INTO transcripts (session_id, id, text) VALUES (?, ?, ?)",
+                             (self.session_id, row["id"], text))
+            self._db.commit()
+            self._count += 1
+            self._recent.append(row)
+        return row
+
+    def recent(self, n):
+        """The last `n` lines (at most `window`), oldest first."""
+        with self._lock:
+            return list(self._recent)[-n:] if n else []
+
+    def page(self, offset, limit):
+        rows = self._db.execute(
+            "SELECT id, text FROM transcripts WHERE session_id = ? AND id >= ? ORDER BY id LIMIT ?",
+            (self.session_id, offset, limit),
+        ).fetchall()
+        return [{"id": i, "text": text, "do_save": True} for i, text in rows]
+
+    def all(self, page_size=1000):
+        rows = []
+        for offset in range(0, self._count, page_size):
+            rows.extend(self.page(offset, page_size))
+        return rows
+
+    def update_texts(self, texts):
+        """Replaces the text of lines by id, e.g. with refined text: {id: text}."""
+        with self._lock:
+            self._db.executemany("UPDATE transcripts SET text = ? WHERE session_id = ? AND id = ?",
+                                 [(text, self.session_id, i) for i, text in texts.items()])
+            self._db.commit()
+            for row in self._recent:
+                if row["id"] in texts:
+                    row["text"] = texts[row["id"]]
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM transcripts WHERE session_id = ?", (self.session_id,))
+            self._db.commit()
+            self._recent.clear()
+            self._count = 0